@@ -1,24 +1,82 @@
 import streamlit as st
-from utils import read_books, read_transactions, borrow_book, return_book, add_book, edit_book
-from rag import RAG
+from utils import query_books, query_transactions, iter_transactions_csv, open_loans, borrow_book, return_book, add_book, edit_book, export_excel, data_version
+import metrics
+from rag import RAG, startup_report
 import pandas as pd
 import os
+import tempfile
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
-rag = RAG()  # Reinitialize RAG to ensure fresh data load
+PAGE_CACHE_ENTRIES = 256  # cached pages per loader; older data versions age out instead of piling up
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'library-exports')
+EXPORT_TTL_SECONDS = 15 * 60  # exports from sessions that ended without downloading are removed after this
+
+@st.cache_resource
+def get_rag():
+    # One engine per server process, shared by all sessions; it re-syncs itself when data_version() moves.
+    # The model and indexes load in a background thread so the first page renders straight away
+    rag = RAG()
+    rag.warm_up()
+    metrics.start_http_server()  # only when LIBRARY_METRICS_PORT is set
+    return rag
+
+# Only the visible page is read; version in the cache key drops stale pages after any write
+@st.cache_data(max_entries=PAGE_CACHE_ENTRIES)
+def load_books_page(version, search, available_only, sort, descending, page, page_size):
+    return query_books(search, available_only, sort, descending, page, page_size)
+
+@st.cache_data(max_entries=PAGE_CACHE_ENTRIES)
+def load_transactions_page(version, book_id, action, page, page_size):
+    return query_transactions(book_id, action, page=page, page_size=page_size)
+
+def discard_export():
+    # Drops this session's CSV once it has been downloaded (or replaced), so user emails and
+    # phone numbers do not stay on disk
+    export_path = st.session_state.pop('export_path', None)
+    if export_path and os.path.exists(export_path):
+        os.remove(export_path)
+
+def sweep_exports():
+    # Streamlit has no end-of-session hook, so abandoned exports are removed by age instead
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - EXPORT_TTL_SECONDS
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:  # another session swept it first
+            pass
+
+def show_books(key):
+    # Filter/sort/page controls plus one page of the catalog; key keeps Browse and Admin widgets apart
+    search_col, sort_col, order_col, available_col = st.columns([3, 2, 1, 1])
+    search = search_col.text_input("Search title, author or tags", key=f"{key}_search")
+    sort = sort_col.selectbox("Sort by", ['book_id', 'title', 'author', 'copies'], key=f"{key}_sort")
+    descending = order_col.checkbox("Descending", key=f"{key}_descending")
+    available_only = available_col.checkbox("Available only", key=f"{key}_available")
+    page_col, size_col = st.columns(2)
+    page_size = size_col.selectbox("Rows per page", [25, 50, 100, 200], index=1, key=f"{key}_page_size")
+    page = page_col.number_input("Page", min_value=1, value=1, key=f"{key}_page")
+    books, total = load_books_page(data_version(), search.strip(), available_only, sort, descending, page, page_size)
+    if total == 0:
+        st.warning("No books match these filters." if search or available_only else "No book data available. Please check 'books.xlsx'.")
+        return
+    st.dataframe(books)
+    st.caption(f"Page {page} of {(total + page_size - 1) // page_size} ({total} books)")
+
+rag = get_rag()
 
 # Create tabs for navigation
 tabs = st.tabs(["Browse & Borrow", "Return Book", "Admin", "LLM Chat"])
 
 with tabs[0]:
     st.title("Browse & Borrow Books")
-    books = read_books()
-    if not books.empty:
-        st.dataframe(books)
-    else:
-        st.warning("No book data available. Please check 'books.xlsx'.")
+    show_books('browse')
     
     st.subheader("Borrow a Book")
     with st.form("borrow_form"):
@@ -34,7 +92,6 @@ with tabs[0]:
             success, message = borrow_book(book_id, user_details)
             if success:
                 st.success(message)
-                rag.refresh_index()
             else:
                 st.error(message)
 
@@ -55,24 +112,35 @@ with tabs[1]:
             success, message = return_book(book_id, user_details)
             if success:
                 st.success(message)
-                rag.refresh_index()
             else:
                 st.error(message)
+    
+    st.subheader("Open Loans")
+    loans_id_email = st.text_input("ID/Email to look up")
+    if loans_id_email:
+        loans = open_loans(loans_id_email)
+        if loans:
+            st.dataframe(pd.DataFrame({'book_id': list(loans), 'copies': list(loans.values())}))
+        else:
+            st.info("No books are currently on loan to this ID/Email.")
 
 with tabs[2]:
     st.title("Admin Panel")
     
     st.subheader("View Books")
-    books = read_books()
-    if not books.empty:
-        st.dataframe(books)
-    else:
-        st.warning("No book data available. Please check 'books.xlsx'.")
+    show_books('admin')
     
     st.subheader("View Latest Transactions")
-    transactions = read_transactions()
-    if not transactions.empty:
-        st.dataframe(transactions.tail(200))
+    action_col, book_col, page_col = st.columns(3)
+    action = action_col.selectbox("Action", ['all', 'borrow', 'return'])
+    filter_book_id = book_col.number_input("Book ID (0 for all)", min_value=0, value=0)
+    transactions_page = page_col.number_input("Page", min_value=1, value=1, key="transactions_page")
+    transactions, transactions_total = load_transactions_page(
+        data_version(), filter_book_id or None, None if action == 'all' else action, transactions_page, 200
+    )
+    if transactions_total:
+        st.dataframe(transactions)
+        st.caption(f"Page {transactions_page} of {(transactions_total + 199) // 200} ({transactions_total} transactions, newest first)")
     else:
         st.warning("No transaction data available. Please check 'transactions.xlsx'.")
     
@@ -89,7 +157,6 @@ with tabs[2]:
             book_data = {'title': title, 'author': author, 'copies': copies, 'description': description, 'tags': tags}
             book_id = add_book(book_data)
             st.success(f"Book added with ID {book_id}")
-            rag.refresh_index()
     
     st.subheader("Edit Book")
     with st.form("edit_book_form"):
@@ -111,44 +178,77 @@ with tabs[2]:
             success, message = edit_book(book_id, book_data)
             if success:
                 st.success(message)
-                rag.refresh_index()
             else:
                 st.error(message)
     
     st.subheader("Export Transactions")
-    transactions = read_transactions()
-    if not transactions.empty:
-        csv = transactions.to_csv(index=False)
-        st.download_button("Download CSV", csv, "transactions.csv", "text/csv")
+    # Built only on request, streamed chunk by chunk to a temporary file private to this session
+    sweep_exports()
+    if st.button("Prepare CSV"):
+        discard_export()
+        os.makedirs(EXPORT_DIR, mode=0o700, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', dir=EXPORT_DIR, newline='', encoding='utf-8', delete=False) as export_file:
+            for chunk in iter_transactions_csv():
+                export_file.write(chunk)
+        st.session_state['export_path'] = export_file.name
+    export_path = st.session_state.get('export_path')
+    if export_path and os.path.exists(export_path):
+        with open(export_path, 'rb') as export_file:
+            st.download_button("Download CSV", export_file, "transactions.csv", "text/csv", on_click=discard_export)
+    
+    if st.button("Export to Excel"):
+        success, message = export_excel()
+        if success:
+            st.success(message)
+        else:
+            st.warning(message)
+    
+    st.subheader("Startup Time")
+    if not rag.is_ready():
+        st.info("The chat engine is still loading in the background.")
+    st.json(startup_report())
+    
+    st.subheader("Answer Routes")
+    st.caption("Questions answered directly from library data versus through the language model, with latency per route")
+    st.json(rag.router.stats())
+    
+    st.subheader("Metrics")
+    if metrics.ENABLED:
+        with st.expander("Stage timings, cache and index counters, LLM tokens (Prometheus text format)"):
+            st.code(metrics.render(), language='text')
     else:
-        st.warning("No transaction data to export.")
+        st.info("Metrics are disabled (LIBRARY_METRICS=0).")
 
 with tabs[3]:
     st.title("LLM Chat with RAG")
     query = st.text_input("Ask a question about books or transactions")
     if query:
         try:
-            context = rag.retrieve(query)
-            response = rag.generate(query, context)
-            # Parse thinking and answer
-            think_part = ""
-            answer_part = response
-            if "<think>" in response and "</think>" in response:
-                parts = response.split("</think>")
-                think_part = parts[0].replace("<think>", "").strip() if parts[0] else "No reasoning provided."
-                answer_part = parts[1].strip() if len(parts) > 1 and parts[1] else "No answer generated."
-            else:
-                think_part = "The model did not provide a detailed reasoning process."
-                answer_part = response if response else "No response generated."
-            # Display answer directly and thinking in a dropdown
-            if answer_part:
-                st.write(answer_part)
-            else:
-                st.warning("No answer available.")
+            # Stream the answer in place; the reasoning fills its expander as it arrives
+            answer_box = st.empty()
             with st.expander("View Model's Reasoning Process"):
-                if think_part:
-                    st.write(think_part)
+                think_box = st.empty()
+            think_part = ""
+            answer_part = ""
+            answer_metrics = None
+            for kind, text in rag.ask_stream(query):
+                if kind == 'think':
+                    think_part += text
+                    think_box.write(think_part)
+                elif kind == 'answer':
+                    answer_part += text
+                    answer_box.write(answer_part)
                 else:
-                    st.write("No reasoning process available.")
+                    answer_metrics = text
+            if not answer_part.strip():
+                answer_box.warning("No answer available.")
+            if not think_part.strip():
+                think_box.write("No reasoning process available.")
+            if answer_metrics and answer_metrics['route'] != 'llm':
+                st.caption(f"Answered directly from library data in {answer_metrics['total_time'] * 1000:.0f} ms")
+            elif answer_metrics and answer_metrics['cache'] != 'miss':
+                st.caption(f"Answered from cache in {answer_metrics['total_time'] * 1000:.0f} ms")
+            elif answer_metrics:
+                st.caption(f"First token after {answer_metrics['time_to_first_token']:.2f}s, {answer_metrics['tokens_per_second']:.1f} tokens/s, {answer_metrics['prompt_tokens']} prompt tokens")
         except Exception as e:
             st.error(f"An error occurred: {str(e)}. Please check the terminal for details.")
\ No newline at end of file
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+import numpy as np
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+QUERIES = [
+    "Recommend a book about building better habits",
+    "Which books on stress management are available?",
+    "Who borrowed books about mindfulness recently?",
+    "Is there anything on relationships and attachment?",
+    "What should I read to become more resilient?",
+    "Books about leadership and career growth",
+    "Tell me about Book ID 42",
+    "What are the most popular psychology books?",
+]
+# Answered by the query router without retrieval or the LLM
+ROUTED_QUERIES = [
+    "Is book 42 available?",
+    "How many books are available?",
+    "How many books are in mindfulness?",
+    "Which books are available in stress management?",
+    "Last 5 borrowed books",
+    "What is the most recent transaction for book 7?",
+]
+
+# Drives storage writes, index refreshes, retrieval, insights and full answers (with an offline
+# LLM) against a synthetic library.db, then prints one JSON report:
+#   python benchmark.py --scale 100k --users 8 --output results.json
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+def summarize(latencies, elapsed):
+    latencies = np.array(latencies) * 1000
+    return {
+        'ops': len(latencies),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_ops': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'max_ms': round(float(latencies.max()), 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def run(operation, count, users):
+    # Calls operation(i) count times, spread over users threads; returns the latency summary
+    def timed(i):
+        start = time.perf_counter()
+        operation(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if users == 1:
+        latencies = [timed(i) for i in range(count)]
+    else:
+        with ThreadPoolExecutor(users) as executor:
+            latencies = list(executor.map(timed, range(count)))
+    return summarize(latencies, time.perf_counter() - start)
+
+def timed_once(operation):
+    start = time.perf_counter()
+    result = operation()
+    return {'seconds': round(time.perf_counter() - start, 3), 'result': result, 'peak_rss_mb': peak_rss_mb()}
+
+def main(args):
+    # storage, utils and rag read LIBRARY_DATA_DIR / LLM settings at import, so they are imported here
+    from create_sample_data import SCALES, write_synthetic
+    from llm_gateway import LLMGateway, MockBackend
+    from rag import RAG, startup_report
+    from utils import borrow_book, read_books, return_book
+
+    book_count, transaction_count = SCALES[args.scale]
+    book_count = book_count if args.books is None else args.books
+    transaction_count = transaction_count if args.transactions is None else args.transactions
+    report = {
+        'scale': {'books': book_count, 'transactions': transaction_count, 'users': args.users},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': {},
+    }
+    results = report['results']
+    results['generate_data'] = timed_once(lambda: write_synthetic(args.data_dir, book_count, transaction_count, args.seed))
+
+    gateway = LLMGateway(MockBackend(latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second))
+    rag = RAG(gateway=gateway)
+    results['refresh_index_cold'] = timed_once(lambda: rag.refresh_index())
+    results['refresh_index_noop'] = timed_once(lambda: rag.refresh_index())
+    results['startup'] = startup_report()
+
+    # Borrow/return pairs on random in-stock books; each worker is its own borrower
+    rng = random.Random(args.seed)
+    in_stock = read_books(['book_id', 'copies']).query('copies > 0')['book_id'].tolist()
+    def borrow_and_return(i):
+        user = {'name': f"Bench User {i}", 'college': 'Bench College', 'id_email': f"bench{i}@example.edu", 'phone': '555-0000000'}
+        book_id = rng.choice(in_stock)
+        if borrow_book(book_id, user)[0]:
+            return_book(book_id, user)
+    results['borrow_return_single'] = run(borrow_and_return, args.operations, 1)
+    results['borrow_return_concurrent'] = run(borrow_and_return, args.operations, args.users)
+    results['refresh_index_incremental'] = timed_once(lambda: rag.refresh_index())
+
+    query = lambda i: QUERIES[i % len(QUERIES)]
+    results['retrieve_single'] = run(lambda i: rag.retrieve(query(i)), args.operations, 1)
+    results['retrieve_concurrent'] = run(lambda i: rag.retrieve(query(i)), args.operations, args.users)
+    results['generate_insights'] = run(lambda i: rag.generate_insights(), args.operations, 1)
+
+    # Numbered queries defeat the response cache so every ask reaches retrieval and the stubbed LLM
+    results['ask_single'] = run(lambda i: rag.ask(f"{query(i)} (request {i})"), args.llm_operations, 1)
+    results['ask_concurrent'] = run(lambda i: rag.ask(f"{query(i)} (concurrent {i})"), args.llm_operations, args.users)
+    results['ask_routed'] = run(lambda i: rag.ask(ROUTED_QUERIES[i % len(ROUTED_QUERIES)]), args.operations, args.users)
+    results['routes'] = rag.router.stats()
+    results['llm_gateway'] = gateway.stats()
+    results['context'] = rag.context_stats
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark storage, indexing, retrieval and answers on a synthetic library.")
+    parser.add_argument('--scale', choices=['1k', '100k', '1m'], default='1k')
+    parser.add_argument('--books', type=int, default=None, help="override the scale's book count")
+    parser.add_argument('--transactions', type=int, default=None, help="override the scale's transaction count")
+    parser.add_argument('--users', type=int, default=8, help="threads for the concurrent phases")
+    parser.add_argument('--operations', type=int, default=200, help="calls per storage/retrieval phase")
+    parser.add_argument('--llm-operations', type=int, default=50, help="calls per ask phase")
+    parser.add_argument('--llm-latency', type=float, default=0.05, help="stubbed LLM time to first token, seconds")
+    parser.add_argument('--llm-tokens-per-second', type=float, default=2000.0)
+    parser.add_argument('--data-dir', default=None, help="where the synthetic library.db and indexes go (default: a new temp dir)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    args.data_dir = args.data_dir or tempfile.mkdtemp(prefix='library-bench-')
+    os.environ['LIBRARY_DATA_DIR'] = args.data_dir
+    os.environ['LIBRARY_STORAGE'] = 'sqlite'
+    with redirect_stdout(sys.stderr):  # keeps any stray library output out of the JSON on stdout
+        report = main(args)
+    report['data_dir'] = args.data_dir
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text)
+    print(text)
@@ -0,0 +1,128 @@
+import os
+import re
+
+import pandas as pd
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('RAG_CONTEXT_TOKENS', '1500'))
+# Squared L2 between unit-norm MiniLM vectors (0 = identical, 2 = unrelated); rows further away are dropped
+MAX_DISTANCE = float(os.getenv('RAG_MAX_DISTANCE', '1.8'))
+MAX_CELL_CHARS = 200
+
+BOOK_LABELS = {
+    'book_id': 'Book ID', 'title': 'Title', 'author': 'Author', 'copies': 'Copies Available',
+    'tags': 'Tags', 'description': 'Description',
+}
+TRANSACTION_LABELS = {
+    'transaction_id': 'Transaction ID', 'book_id': 'Book ID', 'action': 'Action', 'user_name': 'User',
+    'user_college': 'College', 'user_id_email': 'ID/Email', 'user_phone': 'Phone', 'timestamp': 'Timestamp',
+}
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prose; close enough for budgeting without a tokenizer
+    return (len(text) + 3) // 4
+
+def _mentions(query, words):
+    return re.search(r'\b(' + '|'.join(words) + r')', query) is not None
+
+def book_columns(query):
+    query = query.lower()
+    columns = ['book_id', 'title', 'author', 'copies', 'tags']
+    if _mentions(query, ['about', 'describ', 'summar', 'recommend', 'similar', 'plot', 'topic', 'what is']):
+        columns.append('description')
+    return columns
+
+def transaction_columns(query):
+    # Contact details stay out of the prompt unless the question asks for them
+    query = query.lower()
+    columns = ['transaction_id', 'book_id', 'action', 'user_name', 'timestamp']
+    if _mentions(query, ['college', 'universit', 'school']):
+        columns.append('user_college')
+    if _mentions(query, ['email', 'contact', 'id/email', 'student id']):
+        columns.append('user_id_email')
+    if _mentions(query, ['phone', 'contact', 'call']):
+        columns.append('user_phone')
+    return columns
+
+def adaptive_top_k(query, top_k):
+    # Returns (books_k, transactions_k)
+    query = query.lower()
+    if re.search(r'\bbook\s*(id)?\s*[:#]?\s*\d+\b', query):
+        return 3, top_k  # a specific book; its transactions still matter
+    last_n = re.search(r'\b(?:last|latest|recent)\s+(\d+)\b', query)
+    if last_n:
+        return top_k, max(1, int(last_n.group(1)))
+    if _mentions(query, ['all', 'list', 'which', 'every', 'available', 'how many']):
+        return top_k * 2, top_k
+    if _mentions(query, ['borrow', 'return', 'transaction', 'who', 'when']):
+        return top_k // 2 or 1, top_k * 2
+    return top_k, top_k
+
+def relevant_ids(distances, ids, max_distance=MAX_DISTANCE):
+    # Drops FAISS padding (-1), rows past the distance cutoff and repeats; the best hit is always kept
+    kept = []
+    for rank, (distance, row_id) in enumerate(zip(distances, ids)):
+        if row_id < 0 or row_id in kept:
+            continue
+        if rank > 0 and distance > max_distance:
+            break
+        kept.append(int(row_id))
+    return kept
+
+def _cell(value):
+    if pd.isna(value):
+        return ''
+    text = ' '.join(str(value).split())
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 3] + '...'
+
+def serialize_rows(df, labels, budget):
+    # Compact pipe-separated table, one row per line, stopping before the token budget is exceeded
+    columns = [column for column in labels if column in df.columns]
+    header = ' | '.join(labels[column] for column in columns)
+    lines = [header]
+    tokens = estimate_tokens(header)
+    seen = set()
+    for row in df[columns].itertuples(index=False):
+        line = ' | '.join(_cell(value) for value in row)
+        if line in seen:
+            continue
+        line_tokens = estimate_tokens(line) + 1
+        if tokens + line_tokens > budget:
+            break
+        seen.add(line)
+        lines.append(line)
+        tokens += line_tokens
+    return '\n'.join(lines), len(lines) - 1, tokens
+
+def build_context(books, transactions, insights, budget=CONTEXT_TOKEN_BUDGET):
+    # books / transactions are already projected and ordered by relevance; insights are small
+    # and always fit first, books may use 60% of what remains and transactions get the rest
+    insight_lines = []
+    insights_tokens = 0
+    for line in insights.split('\n'):
+        line_tokens = estimate_tokens(line) + 1
+        if insights_tokens + line_tokens > budget // 4:
+            continue  # one oversized line must not push out the shorter ones after it
+        insight_lines.append(line)
+        insights_tokens += line_tokens
+    remaining = budget - insights_tokens
+
+    if books is not None and not books.empty:
+        books_text, books_rows, books_tokens = serialize_rows(books, BOOK_LABELS, int(remaining * 0.6))
+    else:
+        books_text, books_rows, books_tokens = "No books found.", 0, 0
+    remaining -= books_tokens
+
+    if transactions is None:
+        transactions_text, transactions_rows, transactions_tokens = "No transactions available.", 0, 0
+    elif transactions.empty:
+        transactions_text, transactions_rows, transactions_tokens = "No transactions found.", 0, 0
+    else:
+        transactions_text, transactions_rows, transactions_tokens = serialize_rows(transactions, TRANSACTION_LABELS, remaining)
+
+    insights_text = '\n'.join(insight_lines)
+    context = f"Books (real-time data):\n{books_text}\n\nTransactions:\n{transactions_text}\n\nInsights:\n{insights_text}"
+    return context, {
+        'context_tokens': estimate_tokens(context),
+        'books_rows': books_rows,
+        'transactions_rows': transactions_rows,
+    }
@@ -1,3 +1,7 @@
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
@@ -67,12 +71,113 @@ transactions_data = {
     'timestamp': []
 }
 
-# Create DataFrames
-books_df = pd.DataFrame(books_data)
-transactions_df = pd.DataFrame(transactions_data)
+# Synthetic data for load testing: (books, transactions) per scale
+SCALES = {'1k': (1_000, 1_000), '100k': (100_000, 100_000), '1m': (1_000_000, 1_000_000)}
+TITLE_WORDS = ['Habits', 'Courage', 'Mind', 'Ritual', 'Stress', 'Focus', 'Boundaries', 'Growth', 'Calm', 'Purpose', 'Change', 'Resilience', 'Attention', 'Kindness', 'Balance', 'Power']
+TITLE_PATTERNS = ['The {} of {}', '{} and {}', 'A Guide to {} and {}', 'Beyond {}: {}', 'The Little Book of {} and {}']
+FIRST_NAMES = ['Alex', 'Priya', 'Sam', 'Maya', 'Jordan', 'Wei', 'Fatima', 'Diego', 'Hana', 'Omar', 'Lena', 'Kofi']
+LAST_NAMES = ['Clear', 'Smith', 'Brown', 'Levine', 'Kishimi', 'Garcia', 'Chen', 'Okafor', 'Novak', 'Rao', 'Silva', 'Kim']
+TAGS = ['self-help', 'habits', 'mental health', 'mindfulness', 'relationships', 'stress management', 'empowerment', 'psychology', 'mindset', 'vulnerability', 'productivity', 'leadership', 'philosophy', 'wellness', 'career', 'parenting']
+COLLEGES = ['City College', 'State University', 'Tech Institute', 'Arts Academy', 'Medical School']
+RETURN_RATE = 0.8  # share of loans that have been returned
+
+def synthetic_books(count, seed=0):
+    rng = np.random.default_rng(seed)
+    words = rng.integers(len(TITLE_WORDS), size=(count, 2))
+    patterns = rng.integers(len(TITLE_PATTERNS), size=count)
+    first_tags = rng.integers(1, len(TAGS), size=count)
+    return pd.DataFrame({
+        'book_id': np.arange(1, count + 1),
+        'title': [TITLE_PATTERNS[p].format(TITLE_WORDS[a], TITLE_WORDS[b]) + f" Vol. {i}" for i, (p, (a, b)) in enumerate(zip(patterns, words), start=1)],
+        'author': [f"{FIRST_NAMES[a]} {LAST_NAMES[b]}" for a, b in rng.integers(len(FIRST_NAMES), size=(count, 2))],
+        'copies': rng.integers(1, 11, size=count),
+        'description': [f"A practical book about {TAGS[t]} and {TITLE_WORDS[a].lower()}." for t, (a, _) in zip(first_tags, words)],
+        'tags': ['self-help, ' + TAGS[t] for t in first_tags],
+    })
+
+def synthetic_transactions(books, count, seed=0, days=365, users=None):
+    # Borrow/return pairs from a fixed user pool. A book's copies are raised where needed to cover
+    # the most loans it ever had out at once, then reduced by the loans still open, so no borrow
+    # in the log outran the shelf and the log, the shelf counts and the inventory index all agree
+    rng = np.random.default_rng(seed + 1)
+    users = users or max(10, count // 20)
+    loans = int(count / (1 + RETURN_RATE) * 1.1) + 1  # headroom for returns that would fall in the future
+    book_ids = books['book_id'].to_numpy()[rng.integers(len(books), size=loans)]
+    user_ids = rng.integers(users, size=loans)
+    borrowed_at = np.datetime64(datetime.now(), 's') - rng.integers(days * 86400, size=loans).astype('timedelta64[s]')
+    returned = rng.random(loans) < RETURN_RATE
+    returned_at = borrowed_at + rng.integers(3600, 21 * 86400, size=loans).astype('timedelta64[s]')
+    returned &= returned_at < np.datetime64(datetime.now(), 's')
+
+    events = pd.DataFrame({
+        'loan': np.concatenate([np.arange(loans), np.flatnonzero(returned)]),
+        'book_id': np.concatenate([book_ids, book_ids[returned]]),
+        'user': np.concatenate([user_ids, user_ids[returned]]),
+        'action': ['borrow'] * loans + ['return'] * int(returned.sum()),
+        'timestamp': np.concatenate([borrowed_at, returned_at[returned]]),
+    }).sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+    # Keep the newest events, so the log runs up to now, and no return whose borrow was cut off.
+    # kept[p] is how many events survive when the log starts at position p
+    is_borrow = (events['action'] == 'borrow').to_numpy()
+    weight = np.where(is_borrow, 1 + returned[events['loan']], 0)
+    kept = np.cumsum(weight[::-1])[::-1]
+    start = int(np.flatnonzero(kept >= count)[-1]) if kept[0] >= count else 0
+    events = events.iloc[start:]
+    events = events[events['action'].eq('borrow') | events['loan'].isin(events['loan'][events['action'] == 'borrow'])]
+    if len(events) > count:  # the first borrow brought its return along; leave that loan open
+        events = events.drop(events.index[(events['loan'] == events['loan'].iloc[0]) & (events['action'] == 'return')])
+    events = events.reset_index(drop=True)
+
+    event_books = events['book_id'].to_numpy()
+    out = pd.Series(np.where(events['action'] == 'borrow', 1, -1)).groupby(event_books).cumsum().groupby(event_books)
+    books = books.copy()
+    total_copies = np.maximum(books['copies'], books['book_id'].map(out.max()).fillna(0))
+    books['copies'] = (total_copies - books['book_id'].map(out.last()).fillna(0)).astype(int)
+
+    user = events['user'].to_numpy()
+    transactions = pd.DataFrame({
+        'transaction_id': np.arange(1, len(events) + 1),
+        'book_id': events['book_id'],
+        'action': events['action'],
+        'user_name': [f"{FIRST_NAMES[u % len(FIRST_NAMES)]} {LAST_NAMES[u // len(FIRST_NAMES) % len(LAST_NAMES)]} {u}" for u in user],
+        'user_college': [COLLEGES[u % len(COLLEGES)] for u in user],
+        'user_id_email': [f"user{u}@example.edu" for u in user],
+        'user_phone': [f"555-{u:07d}" for u in user],
+        'timestamp': np.datetime_as_string(events['timestamp'].to_numpy(dtype='datetime64[s]'), unit='s'),
+    })
+    return books, transactions
+
+def write_synthetic(data_dir, book_count, transaction_count, seed=0):
+    # Writes straight to library.db; the Excel backend is capped at ~1M rows per sheet
+    from storage import SQLiteStorage
+
+    os.makedirs(data_dir, exist_ok=True)
+    books, transactions = synthetic_transactions(synthetic_books(book_count, seed), transaction_count, seed)
+    return SQLiteStorage(data_dir).replace_all(books, transactions)
+
+def write_sample():
+    books_df = pd.DataFrame(books_data)
+    transactions_df = pd.DataFrame(transactions_data)
+
+    # Save to Excel
+    books_df.to_excel('books.xlsx', index=False)
+    transactions_df.to_excel('transactions.xlsx', index=False)
 
-# Save to Excel
-books_df.to_excel('books.xlsx', index=False)
-transactions_df.to_excel('transactions.xlsx', index=False)
+    print("Sample data created successfully with 10 self-help books.")
 
-print("Sample data created successfully with 10 self-help books.")
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create the 10-book sample workbooks, or a synthetic library.db for load testing.")
+    parser.add_argument('--scale', choices=SCALES, help="synthetic catalog and log size")
+    parser.add_argument('--books', type=int, help="override the number of synthetic books")
+    parser.add_argument('--transactions', type=int, help="override the number of synthetic transactions")
+    parser.add_argument('--out', default='.', help="directory for the synthetic library.db")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.scale or args.books or args.transactions:
+        book_count, transaction_count = SCALES[args.scale or '1k']
+        book_count, transaction_count = book_count if args.books is None else args.books, transaction_count if args.transactions is None else args.transactions
+        books_count, transactions_count = write_synthetic(args.out, book_count, transaction_count, args.seed)
+        print(f"Synthetic data created with {books_count} books and {transactions_count} transactions in {os.path.join(args.out, 'library.db')}")
+    else:
+        write_sample()
@@ -0,0 +1,92 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+SQLITE_MAX_PARAMS = 500  # stay well under SQLite's bound-parameter limit per statement
+
+# Vectors are keyed by a hash of (model name, exact text), so unchanged rows never hit the model again
+class EmbeddingCache:
+    def __init__(self, path, model_name, max_entries=200000):
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.conn.commit()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def encode(self, texts, encode_fn):
+        keys = [self._key(text) for text in texts]
+        with self.lock:
+            found = self._lookup(keys)
+
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            embeddings = np.asarray(encode_fn([texts[i] for i in missing]), dtype=np.float32)
+            new_entries = {}
+            for i, vector in zip(missing, embeddings):
+                new_entries[keys[i]] = vector
+            found.update(new_entries)
+            with self.lock:
+                self._store(new_entries)
+
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        return np.vstack([found[key] for key in keys])
+
+    def store(self, texts, embeddings):
+        # Pre-populate the cache, e.g. from a bulk import that already encoded these texts
+        entries = {self._key(text): np.asarray(vector, dtype=np.float32) for text, vector in zip(texts, embeddings)}
+        with self.lock:
+            self._store(entries)
+
+    def _lookup(self, keys):
+        found = {}
+        now = time.time()
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), SQLITE_MAX_PARAMS):
+            chunk = unique_keys[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+            self.conn.execute(f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})", [now, *chunk])
+        self.conn.commit()
+        return found
+
+    def _store(self, entries):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(key, vector.astype(np.float32).tobytes(), now) for key, vector in entries.items()]
+        )
+        # Evict least recently used vectors once the cap is exceeded
+        excess = self._count() - self.max_entries
+        if excess > 0:
+            self.conn.execute("DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,))
+        self.conn.commit()
+
+    def _count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        with self.lock:
+            entries = self._count()
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'max_entries': self.max_entries,
+        }
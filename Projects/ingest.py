@@ -0,0 +1,110 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from embedding_cache import EmbeddingCache
+from rag import EMBEDDING_CACHE_SIZE, EMBEDDING_MODEL, build_book_texts, get_embedder
+from storage import DATA_DIR
+from utils import add_books
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_BATCH_SIZE = 256  # MiniLM on CPU saturates well before this; larger batches mostly cost memory
+
+def read_chunks(path, chunk_size):
+    # Streams a CSV or Excel catalog as DataFrames of at most chunk_size rows with lower-case headers
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        workbook = load_workbook(path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(name).strip().lower() for name in next(rows)]
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    yield pd.DataFrame(chunk, columns=header)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=header)
+        finally:
+            workbook.close()
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunk_size):
+            chunk.columns = [str(name).strip().lower() for name in chunk.columns]
+            yield chunk
+
+def _text_column(chunk, name):
+    if name not in chunk.columns:
+        return pd.Series('', index=chunk.index)
+    return chunk[name].fillna('').astype(str).str.strip()
+
+def normalize(chunk):
+    missing = {'title', 'author'} - set(chunk.columns)
+    if missing:
+        raise ValueError(f"Catalog is missing required columns: {', '.join(sorted(missing))}")
+    chunk = chunk[chunk['title'].notna()]
+    copies = pd.to_numeric(chunk['copies'], errors='coerce') if 'copies' in chunk.columns else pd.Series(1, index=chunk.index)
+    return pd.DataFrame({
+        'title': _text_column(chunk, 'title'),
+        'author': _text_column(chunk, 'author'),
+        'copies': copies.fillna(1).clip(lower=0).astype(int),
+        'description': _text_column(chunk, 'description'),
+        'tags': _text_column(chunk, 'tags'),
+    }).reset_index(drop=True)
+
+class Encoder:
+    # Spreads encoding over a pool of CPU worker processes when workers > 1
+    def __init__(self, workers, batch_size):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.pool = None
+        self.embedder = get_embedder()
+
+    def __enter__(self):
+        if self.workers > 1:
+            self.pool = self.embedder.start_multi_process_pool(target_devices=['cpu'] * self.workers)
+        return self
+
+    def encode(self, texts):
+        if self.pool is not None:
+            return self.embedder.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+        return self.embedder.encode(texts, batch_size=self.batch_size)
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.embedder.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+def ingest_catalog(path, chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+    # Inserts each chunk in one storage transaction, then encodes exactly the texts RAG.refresh_index
+    # will build for those rows and stores them in the embedding cache, so the next refresh makes
+    # no model calls for the imported books
+    workers = workers or os.cpu_count() or 1
+    cache = EmbeddingCache(os.path.join(DATA_DIR, 'embeddings.db'), EMBEDDING_MODEL, EMBEDDING_CACHE_SIZE)
+    total = 0
+    start = time.perf_counter()
+    with Encoder(workers, batch_size) as encoder:
+        for chunk in read_chunks(path, chunk_size):
+            books = normalize(chunk)
+            if books.empty:
+                continue
+            books['book_id'] = add_books(books)
+            texts = build_book_texts(books).tolist()
+            cache.store(texts, encoder.encode(texts))
+            total += len(books)
+            elapsed = time.perf_counter() - start
+            print(f"Imported {total} books in {elapsed:.1f}s ({total / elapsed:.0f} rows/sec)")
+    elapsed = time.perf_counter() - start
+    return total, elapsed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk-load a CSV or Excel book catalog with precomputed embeddings.")
+    parser.add_argument('path', help="CSV or .xlsx file with title, author and optional copies, description, tags columns")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows read, inserted and encoded per step")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="sentences per encoder batch")
+    parser.add_argument('--workers', type=int, default=None, help="encoder processes (default: CPU count)")
+    args = parser.parse_args()
+    total, elapsed = ingest_catalog(args.path, args.chunk_size, args.batch_size, args.workers)
+    print(f"Done: {total} books in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/sec)")
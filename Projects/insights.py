@@ -0,0 +1,149 @@
+import heapq
+from collections import Counter
+from datetime import date, timedelta
+
+import pandas as pd
+
+LOW_STOCK_COPIES = 1
+LOW_STOCK_LISTED = 10  # titles named in the low-stock insight; the rest are only counted
+
+# Aggregates maintained incrementally from book edits and new transaction rows, so building
+# the insights text never scans the full catalog or log
+class LibraryStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.books = {}  # book_id -> {'title', 'author', 'copies', 'tags'}
+        self.low_stock = set()
+        self.books_by_tag = {}  # lower-cased tag -> set of book_ids; replaced, never mutated, so readers can hold it
+        self.borrow_counts = Counter()  # book_id -> times borrowed
+        self.top_book_id = None
+        self.daily = {}  # date -> [borrows, returns]
+        self.borrows_by_college = Counter()
+        self.borrows_by_tag = Counter()
+        self.events_by_hour = Counter()
+        self.summary_cache = None  # (date, text); dropped whenever an aggregate changes
+
+    def update_books(self, books_df):
+        self.summary_cache = None
+        retagged = []
+        for row in books_df.to_dict('records'):
+            book_id = int(row['book_id'])
+            tags = [tag.strip() for tag in str(row['tags']).split(',') if tag.strip()] if pd.notna(row['tags']) else []
+            retagged.append((book_id, self.books.get(book_id, {}).get('tags', []), tags))
+            self.books[book_id] = {'title': row['title'], 'author': row['author'], 'copies': row['copies'], 'tags': tags}
+            if row['copies'] <= LOW_STOCK_COPIES:
+                self.low_stock.add(book_id)
+            else:
+                self.low_stock.discard(book_id)
+        self._retag(retagged)
+
+    def remove_books(self, book_ids):
+        self.summary_cache = None
+        retagged = []
+        for book_id in book_ids:
+            book = self.books.pop(book_id, None)
+            if book is not None:
+                retagged.append((book_id, book['tags'], []))
+            self.low_stock.discard(book_id)
+        self._retag(retagged)
+
+    def _retag(self, retagged):
+        # Copy-on-write: only the tag sets that change are copied, then the map is swapped in whole
+        if not retagged:
+            return
+        books_by_tag = dict(self.books_by_tag)
+        copied = set()
+        def members(tag):
+            if tag not in copied:
+                books_by_tag[tag] = set(books_by_tag.get(tag, ()))
+                copied.add(tag)
+            return books_by_tag[tag]
+        for book_id, old_tags, new_tags in retagged:
+            for tag in old_tags:
+                members(tag.lower()).discard(book_id)
+            for tag in new_tags:
+                members(tag.lower()).add(book_id)
+        for tag in copied:
+            if not books_by_tag[tag]:
+                del books_by_tag[tag]
+        self.books_by_tag = books_by_tag
+
+    def rebuild(self, books_df, transactions_df):
+        self.reset()
+        self.update_books(books_df)
+        self.record(transactions_df)
+
+    def record(self, transactions_df):
+        if transactions_df.empty:
+            return
+        self.summary_cache = None
+        timestamps = pd.to_datetime(transactions_df['timestamp'], errors='coerce')
+        is_borrow = (transactions_df['action'] == 'borrow').to_numpy()
+        is_return = (transactions_df['action'] == 'return').to_numpy()
+
+        borrowed = {int(book_id): int(count) for book_id, count in transactions_df.loc[is_borrow, 'book_id'].value_counts().items()}
+        self.borrow_counts.update(borrowed)
+        # Ties go to the lowest book id, so rebuild() and incremental record() calls agree
+        for book_id in borrowed:
+            if self.top_book_id is None or (-self.borrow_counts[book_id], book_id) < (-self.borrow_counts[self.top_book_id], self.top_book_id):
+                self.top_book_id = book_id
+
+        for day, count in timestamps[is_borrow].dt.date.value_counts().items():
+            self.daily.setdefault(day, [0, 0])[0] += int(count)
+        for day, count in timestamps[is_return].dt.date.value_counts().items():
+            self.daily.setdefault(day, [0, 0])[1] += int(count)
+
+        self.borrows_by_college.update(transactions_df.loc[is_borrow, 'user_college'].dropna().astype(str).value_counts().to_dict())
+        for book_id, count in borrowed.items():
+            for tag in self.books.get(book_id, {}).get('tags', []):
+                self.borrows_by_tag[tag] += count
+        self.events_by_hour.update({int(hour): int(count) for hour, count in timestamps.dropna().dt.hour.value_counts().items()})
+
+    def recent_activity(self, days=7):
+        today = date.today()
+        borrows = returns = 0
+        for offset in range(days):
+            day_borrows, day_returns = self.daily.get(today - timedelta(days=offset), (0, 0))
+            borrows += day_borrows
+            returns += day_returns
+        return borrows, returns
+
+    def summary(self):
+        # Cached until the aggregates change; keyed on the day because of the 7-day window
+        today = date.today()
+        if self.summary_cache is None or self.summary_cache[0] != today:
+            self.summary_cache = (today, self._summary())
+        return self.summary_cache[1]
+
+    def _summary(self):
+        insights = []
+
+        top_book = self.books.get(self.top_book_id)
+        if top_book is not None:
+            availability = f"available with {top_book['copies']} copies" if top_book['copies'] > 0 else "out of stock"
+            insights.append(f"Most borrowed book: '{top_book['title']}' by {top_book['author']} (Borrowed {self.borrow_counts[self.top_book_id]} times, currently {availability})")
+
+        if self.low_stock:
+            low_stock_info = []
+            for book_id in heapq.nsmallest(LOW_STOCK_LISTED, self.low_stock):
+                book = self.books[book_id]
+                status = "out of stock" if book['copies'] == 0 else f"low stock (only {book['copies']} copy left)"
+                low_stock_info.append(f"'{book['title']}' by {book['author']} ({status})")
+            if len(self.low_stock) > LOW_STOCK_LISTED:
+                low_stock_info.append(f"and {len(self.low_stock) - LOW_STOCK_LISTED} more")
+            insights.append(f"Books with low availability: {', '.join(low_stock_info)}")
+
+        borrows, returns = self.recent_activity()
+        if borrows or returns:
+            insights.append(f"Last 7 days: {borrows} books borrowed, {returns} books returned")
+
+        if self.borrows_by_college:
+            insights.append("Most active colleges: " + ", ".join(f"{college} ({count} borrows)" for college, count in self.borrows_by_college.most_common(3)))
+        if self.borrows_by_tag:
+            insights.append("Most borrowed tags: " + ", ".join(f"{tag} ({count})" for tag, count in self.borrows_by_tag.most_common(3)))
+        if self.events_by_hour:
+            insights.append("Busiest hours: " + ", ".join(f"{hour:02d}:00 ({count} transactions)" for hour, count in self.events_by_hour.most_common(3)))
+
+        return "\n".join(insights) if insights else "No insights available at this time."
@@ -0,0 +1,106 @@
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+def loan_holder(id_email):
+    # Loans are matched on ID/Email regardless of case or surrounding spaces
+    return str(id_email).strip().lower() if pd.notna(id_email) else ''
+
+def _open_loans(transactions_df):
+    # Open loans as (book_id, holder, copies) columns, replaying the log with a vectorized groupby.
+    # A return with no matching loan is ignored, as in _take_back: the balance is a running sum
+    # floored at zero, whose final value is the plain sum minus its lowest negative prefix
+    events = transactions_df[transactions_df['action'].isin(['borrow', 'return'])]
+    if events.empty:
+        return pd.DataFrame({'book_id': [], 'holder': [], 'copies': []})
+    codes, raw_holders = pd.factorize(events['user_id_email'], use_na_sentinel=False)
+    holder_codes, holders = pd.factorize(pd.Series(raw_holders).map(loan_holder))
+    holder_codes = holder_codes[codes]
+    book_ids = events['book_id'].to_numpy(dtype=np.int64)
+    key = pd.Series(book_ids * len(holders) + holder_codes)
+    balance = pd.Series(np.where(events['action'].to_numpy() == 'borrow', 1, -1)).groupby(key).cumsum()
+    grouped = balance.groupby(key)
+    open_copies = grouped.last() - grouped.min().clip(upper=0)
+    open_copies = open_copies[open_copies > 0]
+    return pd.DataFrame({
+        'book_id': open_copies.index.to_numpy() // len(holders),
+        'holder': holders[open_copies.index.to_numpy() % len(holders)],
+        'copies': open_copies.to_numpy(),
+    })
+
+# Copies on the shelf, copies out and who holds them, per book. Built once from the catalog
+# and transaction log, then updated per event so borrow/return checks are dict lookups
+class Inventory:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.available = {}  # book_id -> copies on the shelf
+        self.out = Counter()  # book_id -> copies on loan
+        self.loans = Counter()  # (book_id, holder) -> copies that holder has out
+        self.loans_by_holder = {}  # holder -> Counter of book_id
+
+    def rebuild(self, books_df, transactions_df):
+        with self.lock:
+            self.available = dict(zip(books_df['book_id'].astype(int), books_df['copies'].fillna(0).astype(int)))
+            loans = _open_loans(transactions_df)
+            book_ids, holders, copies = loans['book_id'].astype(int).tolist(), loans['holder'].tolist(), loans['copies'].astype(int).tolist()
+            self.loans = Counter(dict(zip(zip(book_ids, holders), copies)))
+            self.out = Counter(loans.groupby('book_id')['copies'].sum().astype(int).to_dict())
+            self.loans_by_holder = {}
+            for book_id, holder, count in zip(book_ids, holders, copies):
+                self.loans_by_holder.setdefault(holder, Counter())[book_id] = count
+
+    def _lend(self, book_id, holder):
+        self.out[book_id] += 1
+        self.loans[(book_id, holder)] += 1
+        self.loans_by_holder.setdefault(holder, Counter())[book_id] += 1
+
+    def _take_back(self, book_id, holder):
+        if self.loans[(book_id, holder)] <= 0:
+            return False
+        self.out[book_id] -= 1
+        self.loans[(book_id, holder)] -= 1
+        if not self.loans[(book_id, holder)]:
+            del self.loans[(book_id, holder)]
+        held = self.loans_by_holder[holder]
+        held[book_id] -= 1
+        if not held[book_id]:
+            del held[book_id]
+        return True
+
+    def can_borrow(self, book_id):
+        return self.available.get(int(book_id), 0) > 0
+
+    def can_return(self, book_id, id_email):
+        return self.loans.get((int(book_id), loan_holder(id_email)), 0) > 0
+
+    def borrow(self, book_id, id_email, copies=None):
+        # copies: shelf count after the event when the caller has it, otherwise the cached count is decremented
+        with self.lock:
+            self.available[int(book_id)] = self.available.get(int(book_id), 0) - 1 if copies is None else int(copies)
+            self._lend(int(book_id), loan_holder(id_email))
+
+    def return_copy(self, book_id, id_email, copies=None):
+        with self.lock:
+            returned = self._take_back(int(book_id), loan_holder(id_email))
+            if copies is not None:
+                self.available[int(book_id)] = int(copies)
+            elif returned:
+                self.available[int(book_id)] = self.available.get(int(book_id), 0) + 1
+
+    def set_copies(self, book_id, copies):
+        # Add or edit: copies is the number on the shelf, as stored in the books table
+        with self.lock:
+            self.available[int(book_id)] = int(copies)
+
+    def copies_out(self, book_id):
+        return self.out.get(int(book_id), 0)
+
+    def total_copies(self, book_id):
+        return self.available.get(int(book_id), 0) + self.copies_out(book_id)
+
+    def open_loans(self, id_email):
+        # book_id -> copies this ID/Email currently has out
+        with self.lock:
+            return dict(self.loans_by_holder.get(loan_holder(id_email), {}))
@@ -0,0 +1,83 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+BOOK_ID_PATTERN = re.compile(r'\bbook\s*(?:id)?\s*[:#]?\s*(\d+)\b', re.IGNORECASE)
+RRF_K = 60  # standard reciprocal rank fusion constant
+# Terms in nearly every document add almost nothing to a score but cost a pass over their postings
+MIN_IDF = 0.2  # roughly: skip query terms found in more than ~80% of documents
+STOPWORDS = frozenset("""
+a about above after all also am an and any are as at be been before being below between both but by can
+could did do does doing for from further had has have having he her here hers him his how i if in into is it
+its just me more most my no nor not of off on once only or other our out over own same she should so some such
+than that the their them then there these they this those through to too under until up very was we were what
+when where which while who whom why will with would you your book books recommend recommendation suggest
+""".split())
+
+def tokenize(text):
+    return [term for term in TOKEN_PATTERN.findall(str(text).lower()) if term not in STOPWORDS]
+
+def direct_book_id(query):
+    match = BOOK_ID_PATTERN.search(query)
+    return int(match.group(1)) if match else None
+
+def reciprocal_rank_fusion(rankings, top_k):
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (RRF_K + rank + 1)
+    return [doc_id for doc_id, _ in heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])]
+
+# Okapi BM25 over an inverted index that supports adding and removing single documents,
+# so edits cost O(document length) rather than a rebuild
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self.doc_terms = {}  # doc_id -> Counter of terms, needed to remove the doc later
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, doc_id, text):
+        self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        for term, frequency in terms.items():
+            self.postings[term][doc_id] = frequency
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[doc_id]
+
+    def remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, query, top_k):
+        if not self.doc_terms:
+            return []
+        doc_count = len(self.doc_terms)
+        average_length = self.total_length / doc_count or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            if idf < MIN_IDF:
+                continue
+            for doc_id, frequency in postings.items():
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / average_length
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, nullcontext
+
+MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))  # simultaneous upstream requests per process
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '0.5'))  # seconds; doubles per attempt, with jitter
+DEADLINE = float(os.getenv('LLM_DEADLINE', '60'))  # seconds per request, retries included
+
+class RetryableError(Exception):
+    pass
+
+class GroqBackend:
+    # One AsyncGroq client (and so one pooled httpx connection pool) shared by every request.
+    # The SDK's own retries are disabled; the gateway retries with its own backoff and deadline.
+    def __init__(self, api_key=None, max_connections=MAX_CONCURRENCY):
+        import groq
+        import httpx
+
+        api_key = api_key or os.getenv('GROQ_API_KEY')
+        if not api_key:
+            raise ValueError("GROQ_API_KEY environment variable is not set. Please configure it in your environment.")
+        self.groq = groq
+        self.client = groq.AsyncGroq(
+            api_key=api_key,
+            max_retries=0,
+            timeout=DEADLINE,
+            http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)),
+        )
+
+    def is_retryable(self, error):
+        if isinstance(error, (self.groq.APIConnectionError, self.groq.APITimeoutError)):
+            return True
+        return isinstance(error, self.groq.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+    def retry_after(self, error):
+        response = getattr(error, 'response', None)
+        value = response.headers.get('retry-after') if response is not None else None
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    async def complete(self, messages, model, max_tokens):
+        completion = await self.client.chat.completions.create(messages=messages, model=model, max_tokens=max_tokens)
+        usage = completion.usage
+        return {
+            'content': completion.choices[0].message.content,
+            'usage': {'prompt_tokens': usage.prompt_tokens, 'completion_tokens': usage.completion_tokens} if usage else None,
+        }
+
+    async def stream(self, messages, model, max_tokens):
+        stream = await self.client.chat.completions.create(messages=messages, model=model, max_tokens=max_tokens, stream=True)
+        async for chunk in stream:
+            usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None)  # Groq reports usage on the last chunk
+            yield {
+                'content': chunk.choices[0].delta.content if chunk.choices else None,
+                'usage': {'prompt_tokens': usage.prompt_tokens, 'completion_tokens': usage.completion_tokens} if usage else None,
+            }
+
+class MockBackend:
+    # Offline stand-in with configurable latency, throughput and failure rate, for tests and benchmarks
+    def __init__(self, latency=0.3, tokens_per_second=200.0, failure_rate=0.0, response=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.response = response or "<think>Checked the library context for the answer.</think>\nHere is what the library records show."
+
+    def is_retryable(self, error):
+        return isinstance(error, RetryableError)
+
+    def retry_after(self, error):
+        return None
+
+    def _tokens(self):
+        return self.response.split(' ')
+
+    async def complete(self, messages, model, max_tokens):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RetryableError("mock upstream returned 503")
+        tokens = self._tokens()[:max_tokens]
+        await asyncio.sleep(len(tokens) / self.tokens_per_second)
+        return {'content': ' '.join(tokens), 'usage': {'prompt_tokens': sum(len(m['content']) // 4 for m in messages), 'completion_tokens': len(tokens)}}
+
+    async def stream(self, messages, model, max_tokens):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RetryableError("mock upstream returned 503")
+        tokens = self._tokens()[:max_tokens]
+        for i, token in enumerate(tokens):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield {'content': token if i == 0 else ' ' + token, 'usage': None}
+        yield {'content': None, 'usage': {'prompt_tokens': sum(len(m['content']) // 4 for m in messages), 'completion_tokens': len(tokens)}}
+
+class _SharedStream:
+    # Chunks of one upstream stream, replayed to every caller that asked for the same prompt
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.condition = asyncio.Condition()
+
+class LLMGateway:
+    # Runs all upstream calls on one background asyncio loop: bounded concurrency, exponential
+    # backoff on 429/5xx, a deadline per request and single-flight coalescing of identical
+    # in-flight prompts. complete() and stream() are the blocking entry points for Streamlit threads.
+    def __init__(self, backend, max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES, retry_base_delay=RETRY_BASE_DELAY, deadline=DEADLINE):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.deadline = deadline
+        self.inflight = {}  # prompt key -> Future (complete) or _SharedStream (stream)
+        self.counters = {'requests': 0, 'coalesced': 0, 'retries': 0, 'failures': 0, 'timeouts': 0, 'in_flight': 0, 'max_in_flight': 0}
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = None
+        threading.Thread(target=self.loop.run_forever, name='llm-gateway', daemon=True).start()
+
+    def _key(self, kind, messages, model, max_tokens):
+        payload = json.dumps([kind, model, max_tokens, messages], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @asynccontextmanager
+    async def _slot(self):
+        # One of max_concurrency upstream requests
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            self.counters['in_flight'] += 1
+            self.counters['max_in_flight'] = max(self.counters['max_in_flight'], self.counters['in_flight'])
+            try:
+                yield
+            finally:
+                self.counters['in_flight'] -= 1
+
+    async def _call_with_retries(self, call, hold_slot=True):
+        # hold_slot=False when the caller already holds a slot for longer than the call (streams)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._slot() if hold_slot else nullcontext():
+                    return await call()
+            except Exception as error:
+                if attempt == self.max_retries or not self.backend.is_retryable(error):
+                    raise
+                self.counters['retries'] += 1
+                delay = self.backend.retry_after(error) or self.retry_base_delay * (2 ** attempt) * (0.5 + random.random())
+                await asyncio.sleep(delay)
+
+    async def acomplete(self, messages, model, max_tokens, deadline=None):
+        self.counters['requests'] += 1
+        key = self._key('complete', messages, model, max_tokens)
+        if key in self.inflight:
+            self.counters['coalesced'] += 1
+            return await asyncio.shield(self.inflight[key])
+
+        future = self.loop.create_future()
+        self.inflight[key] = future
+        try:
+            result = await asyncio.wait_for(
+                self._call_with_retries(lambda: self.backend.complete(messages, model, max_tokens)),
+                deadline or self.deadline
+            )
+            future.set_result(result)
+            return result
+        except Exception as error:
+            self.counters['timeouts' if isinstance(error, asyncio.TimeoutError) else 'failures'] += 1
+            future.set_exception(error)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self.inflight[key]
+
+    async def _produce_stream(self, key, shared, messages, model, max_tokens, deadline):
+        async def open_stream():
+            # Retries only cover getting the first chunk; a stream that fails mid-way is not restarted
+            iterator = self.backend.stream(messages, model, max_tokens).__aiter__()
+            first = await iterator.__anext__()
+            return iterator, first
+
+        start = self.loop.time()
+        try:
+            # The slot is held until the stream ends, so max_concurrency bounds open streams too
+            async with self._slot():
+                remaining = deadline - (self.loop.time() - start)
+                iterator, chunk = await asyncio.wait_for(self._call_with_retries(open_stream, hold_slot=False), max(remaining, 0.001))
+                while True:
+                    async with shared.condition:
+                        shared.chunks.append(chunk)
+                        shared.condition.notify_all()
+                    remaining = deadline - (self.loop.time() - start)
+                    chunk = await asyncio.wait_for(iterator.__anext__(), max(remaining, 0.001))
+        except StopAsyncIteration:
+            pass
+        except Exception as error:
+            self.counters['timeouts' if isinstance(error, asyncio.TimeoutError) else 'failures'] += 1
+            shared.error = error
+        finally:
+            self.inflight.pop(key, None)
+            async with shared.condition:
+                shared.done = True
+                shared.condition.notify_all()
+
+    async def astream(self, messages, model, max_tokens, deadline=None):
+        self.counters['requests'] += 1
+        key = self._key('stream', messages, model, max_tokens)
+        shared = self.inflight.get(key)
+        if shared is not None:
+            self.counters['coalesced'] += 1
+        else:
+            shared = _SharedStream()
+            self.inflight[key] = shared
+            self.loop.create_task(self._produce_stream(key, shared, messages, model, max_tokens, deadline or self.deadline))
+
+        position = 0
+        while True:
+            async with shared.condition:
+                await shared.condition.wait_for(lambda: position < len(shared.chunks) or shared.done)
+                chunks = shared.chunks[position:]
+                position = len(shared.chunks)
+                finished = shared.done
+            for chunk in chunks:
+                yield chunk
+            if finished:
+                if shared.error is not None:
+                    raise shared.error
+                return
+
+    def complete(self, messages, model, max_tokens, deadline=None):
+        return asyncio.run_coroutine_threadsafe(self.acomplete(messages, model, max_tokens, deadline), self.loop).result()
+
+    def stream(self, messages, model, max_tokens, deadline=None):
+        # Blocking generator over astream(), fed through a thread-safe queue
+        chunks = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in self.astream(messages, model, max_tokens, deadline):
+                    chunks.put(chunk)
+                chunks.put(done)
+            except Exception as error:
+                chunks.put(error)
+
+        asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        while True:
+            item = chunks.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def stats(self):
+        return dict(self.counters)
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_gateway():
+    # Process-wide gateway shared by every session
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            backend = os.getenv('LLM_BACKEND', 'groq')  # 'groq' or 'mock'
+            _gateway = LLMGateway(MockBackend() if backend == 'mock' else GroqBackend())
+        return _gateway
+
+async def _benchmark(gateway, users, requests_per_user, distinct_prompts):
+    latencies = []
+
+    async def user(user_id):
+        for i in range(requests_per_user):
+            prompt = f"question {(user_id * requests_per_user + i) % distinct_prompts}"
+            start = time.perf_counter()
+            await gateway.acomplete([{'role': 'user', 'content': prompt}], 'mock-model', 200)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(user_id) for user_id in range(users)))
+    return time.perf_counter() - start, sorted(latencies)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the LLM gateway offline against the mock backend.")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=5, help="requests per user")
+    parser.add_argument('--distinct-prompts', type=int, default=50, help="fewer distinct prompts = more coalescing")
+    parser.add_argument('--latency', type=float, default=0.3, help="mock time to first token, seconds")
+    parser.add_argument('--tokens-per-second', type=float, default=200.0)
+    parser.add_argument('--failure-rate', type=float, default=0.05, help="fraction of mock calls failing with a retryable 503")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    gateway = LLMGateway(MockBackend(args.latency, args.tokens_per_second, args.failure_rate), max_concurrency=args.concurrency)
+    elapsed, latencies = asyncio.run_coroutine_threadsafe(
+        _benchmark(gateway, args.users, args.requests, args.distinct_prompts), gateway.loop
+    ).result()
+    total = len(latencies)
+    print(json.dumps({
+        'requests': total,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1),
+        'p50_ms': round(latencies[total // 2] * 1000, 1),
+        'p95_ms': round(latencies[int(total * 0.95) - 1] * 1000, 1),
+        'gateway': gateway.stats(),
+    }, indent=2))
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.getenv('LIBRARY_METRICS', '1') != '0'
+METRICS_PORT = int(os.getenv('LIBRARY_METRICS_PORT', '0'))  # 0 = no HTTP endpoint, the Admin tab still shows the text
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_counters = {}  # (name, labels) -> value
+_gauges = {}  # (name, labels) -> value
+_disabled_span = nullcontext()
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def observe(name, seconds, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+
+def inc(name, value=1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    if not ENABLED:
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+@contextmanager
+def _span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('library_stage_seconds', time.perf_counter() - start, stage=stage)
+
+def span(stage):
+    # with span('retrieve.vector_search'): ...  -- one shared no-op context when metrics are off
+    return _span(stage) if ENABLED else _disabled_span
+
+def timed(stage):
+    # Decorator form of span(); with metrics off the function is returned unwrapped
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with _span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+def render():
+    # Prometheus text exposition format
+    with _lock:
+        histograms = {key: list(values) for key, values in _histograms.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    lines = []
+    for kind, series in [('counter', counters), ('gauge', gauges)]:
+        for name in sorted({name for name, _ in series}):
+            lines.append(f"# TYPE {name} {kind}")
+            for (series_name, labels), value in sorted(series.items()):
+                if series_name == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (series_name, labels), values in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            for bound, count in zip(BUCKETS, values):
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {values[-2]}")
+            lines.append(f"{name}_sum{_labels(labels)} {values[-1]:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {values[-2]}")
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+_server = None
+
+def start_http_server(port=METRICS_PORT):
+    # Serves render() at any path on port for a Prometheus scraper; a no-op when port is 0
+    global _server
+    with _lock:
+        if _server is None and port and ENABLED:
+            _server = ThreadingHTTPServer(('', port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+    return _server
@@ -1,111 +1,435 @@
+import hashlib
+import logging
+import time
+_import_started = time.perf_counter()
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import faiss
-from groq import Groq
 import os
+import threading
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from context import adaptive_top_k, book_columns, build_context, estimate_tokens, relevant_ids, transaction_columns
+from embedding_cache import EmbeddingCache
+from insights import LibraryStats
+from lexical import BM25Index, direct_book_id, reciprocal_rank_fusion
+from llm_gateway import get_gateway
+from metrics import inc, observe, set_gauge, span, timed
+from response_cache import SemanticCache
+from router import QueryRouter
+from storage import DATA_DIR
+from vector_index import VectorIndex
+from utils import changes_since, read_books, read_transactions, data_version
 
 load_dotenv()
 
-GROQ_API_KEY = os.getenv('GROQ_API_KEY')
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY environment variable is not set. Please configure it in your environment.")
-client = Groq(api_key=GROQ_API_KEY)
 MODEL = "deepseek-r1-distill-llama-70b"  # Your specified model
-embedder = SentenceTransformer('all-MiniLM-L6-v2')  # Hugging Face embeddings
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '200000'))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv('RESPONSE_CACHE_THRESHOLD', '0.92'))  # cosine similarity for a near-duplicate query
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '512'))
 
-class RAG:
+# Seconds spent in each startup phase; model_load, data_load and index_build are filled in
+# by the first refresh, which runs on first use or in RAG.warm_up()
+logger = logging.getLogger(__name__)
+startup_times = {'import': time.perf_counter() - _import_started}
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    # sentence_transformers pulls in torch, so the model is only loaded when something needs an embedding
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                start = time.perf_counter()
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(EMBEDDING_MODEL)  # Hugging Face embeddings
+                startup_times['model_load'] = time.perf_counter() - start
+    return _embedder
+
+def _join_columns(df, fields, separator=", "):
+    # Column-wise "Label: value, Label: value" rows. map(str) renders values (including None/NaN)
+    # exactly like the old per-row f-string, so texts stay byte-identical for the embedding cache
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    text = None
+    for label, column in fields:
+        values = df[column].map(str)
+        part = values if label is None else label + ": " + values
+        text = part if text is None else text + separator + part
+    return text
+
+def build_book_texts(df):
+    return _join_columns(df, [('Book ID', 'book_id'), ('Title', 'title'), ('Author', 'author'), ('Description', 'description'), ('Tags', 'tags'), ('Copies Available', 'copies')]) + " (available if copies > 0, out of stock if copies = 0)"
+
+def build_book_lexical_texts(df):
+    return _join_columns(df, [(None, 'title'), (None, 'author'), (None, 'description'), (None, 'tags')], separator=" ")
+
+def build_transaction_texts(df):
+    return _join_columns(df, [('Transaction ID', 'transaction_id'), ('Book ID', 'book_id'), ('Action', 'action'), ('User', 'user_name'), ('College', 'user_college'), ('ID/Email', 'user_id_email'), ('Phone', 'user_phone'), ('Timestamp', 'timestamp')])
+
+def split_think(response):
+    if "<think>" in response and "</think>" in response:
+        parts = response.split("</think>")
+        think_part = parts[0].replace("<think>", "").strip() if parts[0] else "No reasoning provided."
+        answer_part = parts[1].strip() if len(parts) > 1 and parts[1] else "No answer generated."
+    else:
+        think_part = "The model did not provide a detailed reasoning process."
+        answer_part = response if response else "No response generated."
+    return think_part, answer_part
+
+def _partial_tag_length(text, tag):
+    # Length of the longest suffix of text that could be the start of tag
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-length:]):
+            return length
+    return 0
+
+class ThinkStreamParser:
+    # Splits streamed deltas into ('think', text) and ('answer', text) parts as they arrive,
+    # holding back only the few characters that might be a tag split across chunks
     def __init__(self):
+        self.mode = 'start'
+        self.buffer = ''
+        self.reasoning = ''  # think text so far, in case the output ends before </think>
+
+    def feed(self, text):
+        self.buffer += text
+        parts = []
+        while True:
+            if self.mode == 'start':
+                stripped = self.buffer.lstrip()
+                if stripped.startswith('<think>'):
+                    self.buffer = stripped[len('<think>'):]
+                    self.mode = 'think'
+                elif '<think>'.startswith(stripped):
+                    return parts  # not enough text yet to tell
+                else:
+                    self.mode = 'answer'
+            elif self.mode == 'think':
+                end = self.buffer.find('</think>')
+                if end >= 0:
+                    if end:
+                        parts.append(('think', self.buffer[:end]))
+                        self.reasoning += self.buffer[:end]
+                    self.buffer = self.buffer[end + len('</think>'):]
+                    self.mode = 'answer'
+                    continue
+                keep = _partial_tag_length(self.buffer, '</think>')
+                if len(self.buffer) > keep:
+                    parts.append(('think', self.buffer[:len(self.buffer) - keep]))
+                    self.reasoning += self.buffer[:len(self.buffer) - keep]
+                    self.buffer = self.buffer[len(self.buffer) - keep:]
+                return parts
+            else:
+                if self.buffer:
+                    parts.append(('answer', self.buffer))
+                    self.buffer = ''
+                return parts
+
+    def close(self):
+        if self.mode == 'think':
+            # Cut off mid-reasoning (e.g. max_tokens ran out): the reasoning is all there is, so it
+            # becomes the answer too, marked as truncated, instead of leaving the answer empty
+            reasoning = (self.reasoning + self.buffer).strip()
+            parts = [('think', self.buffer)] if self.buffer else []
+            parts.append(('answer', "_The model's output was cut off before it finished reasoning. Partial output:_\n\n" + reasoning if reasoning else "_The model's output was cut off before it produced an answer._"))
+        else:
+            parts = [('answer', self.buffer)] if self.buffer else []
+        self.buffer = ''
+        return parts
+
+def _record_usage(usage):
+    if usage:
+        inc('library_llm_tokens_total', usage['prompt_tokens'], kind='prompt')
+        inc('library_llm_tokens_total', usage['completion_tokens'], kind='completion')
+
+def startup_report():
+    return {phase: round(seconds, 3) for phase, seconds in startup_times.items()}
+
+class RAG:
+    # Construction is cheap: the embedder, indexes and LLM client are created on first use
+    # (or by warm_up()), so pages that never query the engine do not wait for them
+    def __init__(self, gateway=None):
+        self._gateway = gateway  # e.g. LLMGateway(MockBackend()) to run offline
         self.books_index = None
         self.transactions_index = None
         self.books_df = None
         self.transactions_df = None
-        self.refresh_index()
+        self.book_texts = {}  # book_id -> text currently embedded in books_index
+        self.books_lexical = BM25Index()  # keyword side of hybrid book retrieval
+        self.stats = LibraryStats()  # insights aggregates, kept in step with the indexes
+        self.stats_synced = False
+        # One engine is shared by every session; the lock keeps index mutation and search apart
+        self.lock = threading.RLock()
+        self.data_version = None
+        self.embedding_cache = EmbeddingCache(os.path.join(DATA_DIR, 'embeddings.db'), EMBEDDING_MODEL, EMBEDDING_CACHE_SIZE)
+        self.response_cache = SemanticCache(RESPONSE_CACHE_THRESHOLD, RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE)
+        self.context_stats = {'requests': 0, 'context_tokens': 0, 'last': None}
+        self.router = QueryRouter()
+        self.warm_up_thread = None
+
+    @property
+    def gateway(self):
+        if self._gateway is None:
+            self._gateway = get_gateway()
+        return self._gateway
+
+    def warm_up(self):
+        # Loads the model and builds the indexes in the background; queries that arrive first wait on the lock
+        if self.warm_up_thread is None:
+            self.warm_up_thread = threading.Thread(target=self.ensure_fresh, name='rag-warm-up', daemon=True)
+            self.warm_up_thread.start()
+        return self.warm_up_thread
+
+    def is_ready(self):
+        return self.books_index is not None
+
+    def _new_index(self):
+        # Vectors are keyed by book_id so single rows can be replaced in place
+        return faiss.IndexIDMap(faiss.IndexFlatL2(get_embedder().get_sentence_embedding_dimension()))
+
+    def _new_transactions_index(self):
+        # The log grows without bound, so this index switches to ANN search past RAG_ANN_THRESHOLD rows
+        path = os.path.join(DATA_DIR, 'transactions.faiss')
+        return VectorIndex(get_embedder().get_sentence_embedding_dimension(), path, EMBEDDING_MODEL)
 
+    def _encode(self, texts):
+        with span('embed'):
+            return self.embedding_cache.encode(texts, get_embedder().encode)
+
+    def ensure_fresh(self):
+        if self.data_version != data_version():
+            with self.lock:
+                if self.data_version != data_version():
+                    self.refresh_index()
+
+    @timed('refresh')
     def refresh_index(self):
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        books_path = os.path.join(script_dir, 'books.xlsx')
-        transactions_path = os.path.join(script_dir, 'transactions.xlsx')
-        
-        self.books_df = pd.read_excel(books_path)
-        print(f"Loaded {len(self.books_df)} books from {books_path}")  # Debug output
-        self.transactions_df = pd.read_excel(transactions_path)
-        
-        books_texts = self.books_df.apply(
-            lambda row: f"Book ID: {row['book_id']}, Title: {row['title']}, Author: {row['author']}, Description: {row['description']}, Tags: {row['tags']}, Copies Available: {row['copies']} (available if copies > 0, out of stock if copies = 0)", 
-            axis=1
-        )
-        books_embeddings = embedder.encode(books_texts.tolist())
-        
-        dim = books_embeddings.shape[1]
-        self.books_index = faiss.IndexFlatL2(dim)
-        self.books_index.add(books_embeddings.astype(np.float32))
-        print(f"Indexed {self.books_index.ntotal} books in FAISS")  # Debug output
-        
-        self.book_id_to_index = {row['book_id']: idx for idx, row in self.books_df.iterrows()}
-        self.index_to_book_id = {idx: row['book_id'] for idx, row in self.books_df.iterrows()}
-        
-        if not self.transactions_df.empty:
-            transactions_texts = self.transactions_df.apply(
-                lambda row: f"Transaction ID: {row['transaction_id']}, Book ID: {row['book_id']}, Action: {row['action']}, User: {row['user_name']}, College: {row['user_college']}, ID/Email: {row['user_id_email']}, Phone: {row['user_phone']}, Timestamp: {row['timestamp']}", 
-                axis=1
-            )
-            transactions_embeddings = embedder.encode(transactions_texts.tolist())
-            self.transactions_index = faiss.IndexFlatL2(dim)
-            self.transactions_index.add(transactions_embeddings.astype(np.float32))
+        with self.lock:
+            return self._refresh_index()
+
+    def _refresh_index(self):
+        version = data_version()  # read before loading so a concurrent write triggers another refresh
+        first_load = self.books_index is None
+        start = time.perf_counter()
+        with span('refresh.load'):
+            # After the first load only rows written since the last refresh are read and merged;
+            # None means the tables were replaced (or the backend cannot tell) and are read whole
+            changes = None if first_load else changes_since(self.data_version, self._last_transaction_id())
+            if changes is None:
+                self.books_df = read_books()
+                logger.info("Loaded %d books from storage", len(self.books_df))
+                self.transactions_df = read_transactions()
+                changed_books = new_transactions = None
+            else:
+                changed_books, new_transactions = changes
+                self._merge_changes(changed_books, new_transactions)
+        
+        if first_load:
+            startup_times['data_load'] = time.perf_counter() - start
+            get_embedder()
+            start = time.perf_counter()
+            self.books_index = self._new_index()
+            self.transactions_index = self._new_transactions_index()
+        
+        with span('refresh.sync_books'):
+            books_touched = self._sync_books(changed_books)
+        with span('refresh.sync_transactions'):
+            transactions_touched = self._sync_transactions(new_transactions)
+        if first_load:
+            startup_times['index_build'] = time.perf_counter() - start
+            logger.info("Startup: %s", startup_report())
+        logger.debug("Indexed %d books (%d book vectors and %d transaction vectors updated)", self.books_index.ntotal, books_touched, transactions_touched)
+        
+        if changed_books is None or not changed_books.empty:
+            self.book_id_to_index = dict(zip(self.books_df['book_id'], range(len(self.books_df))))
+            self.index_to_book_id = dict(zip(range(len(self.books_df)), self.books_df['book_id']))
+        if new_transactions is None or not new_transactions.empty:
+            self.transaction_positions = pd.Index(self.transactions_df['transaction_id'])
+        self.data_version = version
+        self._record_sizes()
+        
+        return books_touched, transactions_touched
+
+    def _record_sizes(self):
+        set_gauge('library_index_vectors', self.books_index.ntotal, index='books')
+        set_gauge('library_index_vectors', self.transactions_index.ntotal, index='transactions')
+        set_gauge('library_index_vectors', len(self.books_lexical), index='books_bm25')
+        set_gauge('library_rows', len(self.books_df), table='books')
+        set_gauge('library_rows', len(self.transactions_df), table='transactions')
+        cache_stats = self.embedding_cache.stats()
+        set_gauge('library_embedding_cache_hits', cache_stats['hits'])
+        set_gauge('library_embedding_cache_misses', cache_stats['misses'])
+        set_gauge('library_embedding_cache_entries', cache_stats['entries'])
+
+    def _record_answer(self, route, seconds):
+        # Route latencies and response-cache hit rates as gauges, so they reach metrics.render()
+        # alongside the index sizes above
+        self.router.record(route, seconds)
+        for name, stats in self.router.stats().items():
+            set_gauge('library_route_answers', stats['count'], route=name)
+            set_gauge('library_route_latency_avg_seconds', stats['avg_ms'] / 1000, route=name)
+            set_gauge('library_route_latency_max_seconds', stats['max_ms'] / 1000, route=name)
+        cache_stats = self.response_cache.stats()
+        set_gauge('library_response_cache_hits', cache_stats['exact_hits'], kind='exact')
+        set_gauge('library_response_cache_hits', cache_stats['semantic_hits'], kind='semantic')
+        set_gauge('library_response_cache_misses', cache_stats['misses'])
+        set_gauge('library_response_cache_hit_rate', cache_stats['hit_rate'])
+        set_gauge('library_response_cache_entries', cache_stats['entries'])
+
+    def _last_transaction_id(self):
+        return int(self.transactions_df['transaction_id'].iloc[-1]) if not self.transactions_df.empty else 0
+
+    def _merge_changes(self, changed_books, new_transactions):
+        # Builds new frames rather than editing in place: the router reads the old ones without the lock
+        if not changed_books.empty:
+            kept = self.books_df[~self.books_df['book_id'].isin(changed_books['book_id'])]
+            self.books_df = pd.concat([kept, changed_books], ignore_index=True).sort_values('book_id', kind='stable').reset_index(drop=True)
+        if not new_transactions.empty:
+            self.transactions_df = pd.concat([self.transactions_df, new_transactions], ignore_index=True)
+
+    def _sync_books(self, changed_books=None):
+        # changed_books: rows edited or added since the last refresh; None diffs the whole catalog
+        rows = self.books_df if changed_books is None else changed_books
+        texts = {}
+        if not rows.empty:
+            texts = dict(zip(rows['book_id'].astype(int), build_book_texts(rows)))
+        
+        # Books that were edited or deleted lose their old vector; new and edited books get re-embedded
+        if changed_books is None:
+            stale = [book_id for book_id, text in self.book_texts.items() if texts.get(book_id) != text]
+        else:  # books are only removed by replacing the tables, which forces a full reload
+            stale = [book_id for book_id, text in texts.items() if book_id in self.book_texts and self.book_texts[book_id] != text]
+        fresh = [book_id for book_id, text in texts.items() if self.book_texts.get(book_id) != text]
+        if stale:
+            self.books_index.remove_ids(np.array(stale, dtype=np.int64))
+        if fresh:
+            embeddings = self._encode([texts[book_id] for book_id in fresh])
+            self.books_index.add_with_ids(embeddings.astype(np.float32), np.array(fresh, dtype=np.int64))
+        
+        fresh_rows = rows[rows['book_id'].isin(fresh)]
+        for book_id in set(stale) - set(fresh):
+            self.books_lexical.remove(book_id)
+        for book_id, text in zip(fresh_rows['book_id'].astype(int), build_book_lexical_texts(fresh_rows)):
+            self.books_lexical.add(book_id, text)
+        self.stats.remove_books(set(stale) - set(fresh))
+        self.stats.update_books(fresh_rows)
+        
+        if changed_books is None:
+            self.book_texts = texts
         else:
-            self.transactions_index = faiss.IndexFlatL2(dim)
+            self.book_texts.update(texts)
+        return len(set(stale) | set(fresh))
+
+    def _transactions_fingerprint(self, first_id, last_id):
+        # Digest of the first and last indexed rows: a replaced log (storage.py import,
+        # create_sample_data.py --out) reuses ids 1..N with different content
+        rows = self.transactions_df[self.transactions_df['transaction_id'].isin([first_id, last_id])]
+        if rows['transaction_id'].nunique() != len({first_id, last_id}):
+            return None
+        digest = hashlib.sha256('\n'.join(build_transaction_texts(rows.sort_values('transaction_id'))).encode('utf-8')).hexdigest()
+        return {'first': first_id, 'last': last_id, 'digest': digest}
 
-    def retrieve(self, query, top_k=10):  # Increased top_k to ensure all relevant books are retrieved
-        query_emb = embedder.encode([query])
+    def _sync_transactions(self, new_transactions=None):
+        # new_transactions: rows appended since the last refresh; None re-checks the whole log
+        # against the index (first load, or the tables were replaced)
+        removed = set()
+        if new_transactions is None:
+            current_ids = set(self.transactions_df['transaction_id'].astype(int)) if not self.transactions_df.empty else set()
+            
+            fingerprint = self.transactions_index.fingerprint
+            if self.transactions_index.ids and (not fingerprint or fingerprint != self._transactions_fingerprint(fingerprint['first'], fingerprint['last'])):
+                logger.info("Transaction log no longer matches the saved index; rebuilding it")
+                self.transactions_index.reset()
+                self.stats_synced = False
+            
+            # The log is append-only in normal use, so this is usually empty
+            indexed_ids = self.transactions_index.ids
+            removed = indexed_ids - current_ids
+            if removed:
+                self.transactions_index.remove_ids(np.array(sorted(removed), dtype=np.int64))
+            new_rows = self.transactions_df[~self.transactions_df['transaction_id'].isin(indexed_ids)] if current_ids else self.transactions_df
+        else:
+            new_rows = new_transactions
         
-        _, books_indices = self.books_index.search(query_emb.astype(np.float32), top_k)
-        book_ids = [self.index_to_book_id.get(idx, None) for idx in books_indices[0] if idx < len(self.books_df)]
-        books_retrieved = self.books_df[self.books_df['book_id'].isin(book_ids)]
-        books_context = books_retrieved.to_string(index=False) if not books_retrieved.empty else "No books found."
+        if not new_rows.empty:
+            embeddings = self._encode(build_transaction_texts(new_rows).tolist())
+            self.transactions_index.add_with_ids(embeddings.astype(np.float32), new_rows['transaction_id'].to_numpy(dtype=np.int64))
         
-        if self.transactions_index.ntotal > 0:
-            _, trans_indices = self.transactions_index.search(query_emb.astype(np.float32), top_k)
-            trans_retrieved = self.transactions_df.iloc[trans_indices[0]].to_string(index=False) if len(trans_indices[0]) > 0 else "No transactions found."
+        # A persisted index may already hold every row, so the first sync always aggregates the full log
+        if removed or not self.stats_synced:
+            self.stats.rebuild(self.books_df, self.transactions_df)
+            self.stats_synced = True
         else:
-            trans_retrieved = "No transactions available."
+            self.stats.record(new_rows)
+        
+        if new_transactions is None or not new_rows.empty:
+            transaction_ids = self.transactions_df['transaction_id']
+            self.transactions_index.fingerprint = self._transactions_fingerprint(int(transaction_ids.min()), int(transaction_ids.max())) if not transaction_ids.empty else None
+        self.transactions_index.maybe_save()
+        return len(removed) + len(new_rows)
+
+    @timed('retrieve')
+    def retrieve(self, query, top_k=5, query_emb=None):  # hybrid ranking recovers recall that used to need top_k=10
+        self.ensure_fresh()
+        books_k, transactions_k = adaptive_top_k(query, top_k)
+        
+        # "Book ID: N" is answered from the id map with no embedding at all
+        book_id = direct_book_id(query)
+        if book_id is not None:
+            with self.lock:
+                position = self.book_id_to_index.get(book_id)
+                if position is not None:
+                    books_retrieved = self.books_df.iloc[[position]][book_columns(query)]
+                    trans_retrieved = None
+                    if not self.transactions_df.empty:
+                        trans_retrieved = self.transactions_df[self.transactions_df['book_id'] == book_id].tail(transactions_k).iloc[::-1][transaction_columns(query)]
+                    insights = self.generate_insights()
+                    return self._build_context(books_retrieved, trans_retrieved, insights)
+        
+        if query_emb is None:
+            with span('retrieve.embed_query'):
+                query_emb = get_embedder().encode([query])
         
-        insights = self.generate_insights()
+        with self.lock:
+            with span('retrieve.vector_search'):
+                distances, ids = self.books_index.search(query_emb.astype(np.float32), books_k)
+            vector_ranking = relevant_ids(distances[0], ids[0])
+            with span('retrieve.lexical_search'):
+                lexical_ranking = [doc_id for doc_id, _ in self.books_lexical.search(query, books_k)]
+            book_ids = reciprocal_rank_fusion([vector_ranking, lexical_ranking], books_k)
+            positions = [self.book_id_to_index[book_id] for book_id in book_ids if book_id in self.book_id_to_index]
+            books_retrieved = self.books_df.iloc[positions][book_columns(query)]
+            
+            trans_retrieved = None
+            if self.transactions_index.ntotal > 0:
+                with span('retrieve.transaction_search'):
+                    distances, ids = self.transactions_index.search(query_emb.astype(np.float32), transactions_k)
+                positions = self.transaction_positions.get_indexer_for(relevant_ids(distances[0], ids[0]))
+                trans_retrieved = self.transactions_df.iloc[positions[positions >= 0]][transaction_columns(query)]
+            
+            insights = self.generate_insights()
         
-        return f"Books (real-time data):\n{books_context}\n\nTransactions:\n{trans_retrieved}\n\nInsights:\n{insights}"
+        return self._build_context(books_retrieved, trans_retrieved, insights)
 
+    def _build_context(self, books_retrieved, trans_retrieved, insights):
+        with span('retrieve.build_context'):
+            context, stats = build_context(books_retrieved, trans_retrieved, insights)
+        inc('library_context_tokens_total', stats['context_tokens'])
+        with self.lock:
+            self.context_stats['requests'] += 1
+            self.context_stats['context_tokens'] += stats['context_tokens']
+            self.context_stats['last'] = stats
+        return context
+
+    @timed('insights')
     def generate_insights(self):
-        insights = []
-        
-        if not self.transactions_df.empty:
-            borrow_counts = self.transactions_df[self.transactions_df['action'] == 'borrow']['book_id'].value_counts()
-            if not borrow_counts.empty:
-                top_book_id = borrow_counts.index[0]
-                top_book = self.books_df[self.books_df['book_id'] == top_book_id][['title', 'author', 'copies']].iloc[0]
-                availability = f"available with {top_book['copies']} copies" if top_book['copies'] > 0 else "out of stock"
-                insights.append(f"Most borrowed book: '{top_book['title']}' by {top_book['author']} (Borrowed {borrow_counts.iloc[0]} times, currently {availability})")
-        
-        low_stock = self.books_df[self.books_df['copies'] <= 1]
-        if not low_stock.empty:
-            low_stock_info = []
-            for _, row in low_stock.iterrows():
-                status = "out of stock" if row['copies'] == 0 else f"low stock (only {row['copies']} copy left)"
-                low_stock_info.append(f"'{row['title']}' by {row['author']} ({status})")
-            insights.append(f"Books with low availability: {', '.join(low_stock_info)}")
-        
-        if not self.transactions_df.empty:
-            one_week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-            recent_trans = self.transactions_df[self.transactions_df['timestamp'] >= one_week_ago]
-            if not recent_trans.empty:
-                borrow_count = len(recent_trans[recent_trans['action'] == 'borrow'])
-                return_count = len(recent_trans[recent_trans['action'] == 'return'])
-                insights.append(f"Last 7 days: {borrow_count} books borrowed, {return_count} books returned")
-        
-        return "\n".join(insights) if insights else "No insights available at this time."
+        return self.stats.summary()
 
-    def generate(self, query, context):
+    def _messages(self, query, context):
         prompt = f"""Context (real-time data from library system):
 {context}
 
@@ -121,25 +445,123 @@ Instructions:
 - Format the final answer (outside the <think> block) clearly with bullet points or paragraphs for readability.
 - If no relevant information, say so politely.
 """
+        return [
+            {"role": "system", "content": "You are a helpful and insightful library assistant capable of reasoning through queries."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def generate(self, query, context):
+        with span('llm.generate'):
+            completion = self.gateway.complete(self._messages(query, context), MODEL, 1000)
+        _record_usage(completion['usage'])
+        
+        response = completion['content']
+        think_part, answer_part = split_think(response)
+        return f"<think>{think_part}</think>\n{answer_part}"
+
+    def generate_stream(self, query, context):
+        # Yields ('think', text) and ('answer', text) deltas as tokens arrive, then a final
+        # ('metrics', dict) with time-to-first-token and throughput for this request
+        start = time.perf_counter()
+        first_token_at = None
+        chunks = 0
+        completion_tokens = None
+        parser = ThinkStreamParser()
+        messages = self._messages(query, context)
+        prompt_tokens = sum(estimate_tokens(message['content']) for message in messages)
+        
+        for chunk in self.gateway.stream(messages, MODEL, 1000):
+            if chunk['usage'] is not None:
+                completion_tokens = chunk['usage']['completion_tokens']
+                prompt_tokens = chunk['usage']['prompt_tokens']
+            delta = chunk['content']
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            chunks += 1
+            yield from parser.feed(delta)
+        yield from parser.close()
+        
+        end = time.perf_counter()
+        tokens = completion_tokens if completion_tokens is not None else chunks  # one chunk is ~one token
+        generation_time = end - (first_token_at or end)
+        observe('library_stage_seconds', end - start, stage='llm.stream')
+        observe('library_llm_time_to_first_token_seconds', (first_token_at or end) - start)
+        _record_usage({'prompt_tokens': prompt_tokens, 'completion_tokens': tokens})
+        yield 'metrics', {
+            'time_to_first_token': (first_token_at or end) - start,
+            'total_time': end - start,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': tokens,
+            'tokens_per_second': tokens / generation_time if generation_time > 0 else 0.0,
+        }
+
 
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a helpful and insightful library assistant capable of reasoning through queries."},
-                {"role": "user", "content": prompt}
-            ],
-            model=MODEL,
-            max_tokens=1000
-        )
+    def ask_stream(self, query):
+        # Exact aggregate questions are answered by the router; everything else goes through
+        # retrieve + generate_stream behind the response cache. Routed and cached answers are
+        # replayed as a single think/answer pair.
+        start = time.perf_counter()
+        self.ensure_fresh()
+        # Routed against a snapshot: a refresh replaces these objects rather than mutating them,
+        # so the lock is only held long enough to take the references
+        with self.lock:
+            snapshot = self.books_df, self.transactions_df, self.stats.books_by_tag
+        routed = self.router.route(query, *snapshot)
+        if routed is not None:
+            route, answer_part = routed
+            elapsed = time.perf_counter() - start
+            self._record_answer(route, elapsed)
+            inc('library_answers_total', route=route, cache='miss')
+            yield 'think', f"Answered directly from the library data ({route.replace('_', ' ')} query), without the language model."
+            yield 'answer', answer_part
+            yield 'metrics', {'time_to_first_token': elapsed, 'total_time': elapsed, 'prompt_tokens': 0, 'completion_tokens': 0, 'tokens_per_second': 0.0, 'cache': 'miss', 'route': route}
+            return
+        
+        version = self.data_version
+        cache_result = 'exact'
+        query_emb = None
+        response = self.response_cache.get_exact(query, version)
+        if response is None and direct_book_id(query) is None:  # book-id questions skip the embedding entirely
+            cache_result = 'semantic'
+            with span('retrieve.embed_query'):
+                query_emb = get_embedder().encode([query])
+            response = self.response_cache.get_similar(query_emb[0], version)
+        
+        if response is not None:
+            think_part, answer_part = split_think(response)
+            yield 'think', think_part
+            yield 'answer', answer_part
+            elapsed = time.perf_counter() - start
+            yield 'metrics', {'time_to_first_token': elapsed, 'total_time': elapsed, 'prompt_tokens': 0, 'completion_tokens': 0, 'tokens_per_second': 0.0, 'cache': cache_result, 'route': 'llm'}
+            self._record_answer('llm', elapsed)
+            inc('library_answers_total', route='llm', cache=cache_result)
+            return
         
-        response = chat_completion.choices[0].message.content
+        context = self.retrieve(query, query_emb=query_emb)
         think_part = ""
-        answer_part = response
-        if "<think>" in response and "</think>" in response:
-            parts = response.split("</think>")
-            think_part = parts[0].replace("<think>", "").strip() if parts[0] else "No reasoning provided."
-            answer_part = parts[1].strip() if len(parts) > 1 and parts[1] else "No answer generated."
-        else:
-            think_part = "The model did not provide a detailed reasoning process."
-            answer_part = response if response else "No response generated."
+        answer_part = ""
+        for kind, text in self.generate_stream(query, context):
+            if kind == 'think':
+                think_part += text
+            elif kind == 'answer':
+                answer_part += text
+            else:
+                text = {**text, 'cache': 'miss', 'route': 'llm'}
+            yield kind, text
+        self._record_answer('llm', time.perf_counter() - start)
+        inc('library_answers_total', route='llm', cache='miss')
         
-        return f"<think>{think_part}</think>\n{answer_part}"
\ No newline at end of file
+        if answer_part.strip() and query_emb is not None:
+            self.response_cache.put(query, query_emb[0], f"<think>{think_part.strip()}</think>\n{answer_part.strip()}", version)
+
+    def ask(self, query):
+        think_part = ""
+        answer_part = ""
+        for kind, text in self.ask_stream(query):
+            if kind == 'think':
+                think_part += text
+            elif kind == 'answer':
+                answer_part += text
+        return f"<think>{think_part.strip()}</think>\n{answer_part.strip()}"
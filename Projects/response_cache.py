@@ -0,0 +1,94 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+def normalize_query(query):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', query.lower()).split())
+
+# Answers keyed on the query: exact (normalized text) matches skip the embedding entirely,
+# near-duplicates are found by cosine similarity. Every entry carries the data version it
+# was generated against, and a version change empties the cache.
+class SemanticCache:
+    def __init__(self, threshold=0.92, ttl=3600, max_entries=512):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # normalized query -> (unit embedding, response, created_at), LRU order
+        self.version = None
+        self.matrix = None  # stacked embeddings for the semantic lookup, rebuilt lazily
+        self.matrix_keys = []
+        self.lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _check_version(self, version):
+        if version != self.version:
+            self.entries.clear()
+            self.matrix = None
+            self.version = version
+
+    def _hit(self, key):
+        _, response, created_at = self.entries[key]
+        if time.time() - created_at > self.ttl:
+            del self.entries[key]
+            self.matrix = None
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+    def get_exact(self, query, version):
+        with self.lock:
+            self._check_version(version)
+            key = normalize_query(query)
+            response = self._hit(key) if key in self.entries else None
+            if response is not None:
+                self.exact_hits += 1
+            return response
+
+    def get_similar(self, embedding, version):
+        with self.lock:
+            self._check_version(version)
+            if not self.entries:
+                self.misses += 1
+                return None
+            if self.matrix is None:
+                self.matrix_keys = list(self.entries)
+                self.matrix = np.vstack([self.entries[key][0] for key in self.matrix_keys])
+            scores = self.matrix @ _unit(embedding)
+            best = int(np.argmax(scores))
+            key = self.matrix_keys[best]
+            response = self._hit(key) if scores[best] >= self.threshold and key in self.entries else None
+            if response is None:
+                self.misses += 1
+            else:
+                self.semantic_hits += 1
+            return response
+
+    def put(self, query, embedding, response, version):
+        with self.lock:
+            self._check_version(version)
+            key = normalize_query(query)
+            self.entries[key] = (_unit(embedding), response, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.matrix = None
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            'exact_hits': self.exact_hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+        }
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
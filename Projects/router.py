@@ -0,0 +1,163 @@
+import re
+import threading
+
+# Each pattern has to match the whole (normalised) question; anything with extra
+# qualifiers the router does not understand falls through to the LLM
+BOOK_ID = r'book\s*(?:id\s*)?[:#]?\s*(?P<book_id>\d+)'
+AVAILABILITY_BY_ID = [re.compile(pattern) for pattern in (
+    rf'(?:is|are) (?:the )?{BOOK_ID}(?: currently)? (?:available|in stock)(?: (?:right )?now)?',
+    rf'(?:how many copies of|what is the availability of|availability of|check availability (?:of|for)|copies of) (?:the )?{BOOK_ID}(?: (?:are|is) (?:available|left|in stock))?(?: (?:right )?now)?',
+    rf'{BOOK_ID} (?:availability|copies|stock)',
+)]
+COUNT_BOOKS = re.compile(
+    r'how many (?:(?:available|in stock) )?(?:books?|titles?|copies)'
+    r'(?: (?:are|is|do (?:we|you) have|does the library have))?(?: (?:there|in total|total|altogether))?'
+    r'(?: (?:available|in stock|on the shelf))?(?: (?:right )?now)?'
+    r'(?: (?:in|under|tagged) (?:the )?(?P<tag>[a-z][\w &-]*?)(?: (?:category|genre|tag|section|shelf))?)?(?: (?:right )?now)?'
+)
+LATEST_N = re.compile(
+    r'(?:(?:show(?: me)?|list|give me|what (?:is|was|are|were)|which (?:is|was|are|were)) )?(?:the )?'
+    r'(?:last|latest|most recent|recent) (?:(?P<n>\d+) )?(?P<kind>borrowed|returned|borrows?|returns?|transactions?)(?: books?)?'
+    rf'(?: (?:for|of|on) (?:the )?{BOOK_ID})?'
+)
+BOOKS_IN_TAG = re.compile(
+    r'(?:(?:which|what|show(?: me)?|list|find|are there(?: any)?|do you have(?: any)?|any) )?(?:(?:the|all) )?(?:available )?'
+    r'books?(?: (?:are|do you have|do we have|are there))?(?: (?:available|in stock))?'
+    r' (?:in|under|tagged(?: as)?|about|on) (?:the )?(?P<tag>[a-z][\w &-]*?)(?: (?:category|genre|tag|section|shelf))?'
+)
+AVAILABLE = re.compile(r'\b(?:available|in stock)\b')
+NOT_A_TAG = {'stock', 'the library', 'library', 'total', 'catalog', 'the catalog', 'the system', 'system', 'all'}
+DEFAULT_LATEST_N = 5
+MAX_LISTED = 25  # rows named in one routed answer; longer lists end with "and K more"
+
+def _book_line(book):
+    availability = f"available with {book['copies']} copies" if book['copies'] > 0 else "out of stock"
+    return f"- **{book['title']}** by {book['author']} (Book ID {book['book_id']}, tags: {book['tags']}) - {availability}"
+
+def _tagged(books_df, books_by_tag, tag):
+    return books_df[books_df['book_id'].isin(books_by_tag.get(tag, ()))]
+
+def _last_rows(transactions_df, n, action):
+    # Filters growing windows from the end of the log, so the cost follows n rather than the log size
+    window = max(n * 4, 256)
+    while True:
+        tail = transactions_df.tail(window)
+        rows = tail[tail['action'] == action]
+        if len(rows) >= n or window >= len(transactions_df):
+            return rows.tail(n)
+        window *= 4
+
+# Answers exact aggregate questions straight from the dataframes; anything it does not
+# recognise falls through to retrieval + the LLM
+class QueryRouter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.route_stats = {}  # route -> [count, total_seconds, max_seconds]
+
+    def route(self, query, books_df, transactions_df, books_by_tag):
+        # Returns (route_name, answer) or None. books_by_tag maps a lower-cased tag to its book_ids
+        # (LibraryStats.books_by_tag), so tag questions are a set lookup plus one isin()
+        query = ' '.join(query.lower().split()).rstrip('?.! ')
+        for pattern in AVAILABILITY_BY_ID:
+            match = pattern.fullmatch(query)
+            if match:
+                return 'availability_by_id', self._availability_by_id(int(match.group('book_id')), books_df)
+        match = LATEST_N.fullmatch(query)
+        if match:
+            kind = match.group('kind')
+            # "the most recent transaction" asks for one row, "recent transactions" for a few
+            n = min(int(match.group('n') or (1 if kind in ('borrow', 'return', 'transaction') else DEFAULT_LATEST_N)), MAX_LISTED)
+            book_id = int(match.group('book_id')) if match.group('book_id') else None
+            return 'latest_n', self._latest_n(n, kind, book_id, books_df, transactions_df)
+        available_only = bool(AVAILABLE.search(query))
+        match = COUNT_BOOKS.fullmatch(query)
+        if match:
+            tag = match.group('tag')
+            if tag is None or tag in NOT_A_TAG:
+                return 'count', self._count(available_only, books_df)
+            if tag in books_by_tag:
+                return 'count', self._count_tag(tag, available_only, books_df, books_by_tag)
+            return None
+        match = BOOKS_IN_TAG.fullmatch(query)
+        if match and match.group('tag') in books_by_tag:
+            return 'filter_by_tag', self._filter_by_tag(match.group('tag'), available_only, books_df, books_by_tag)
+        return None
+
+    def _availability_by_id(self, book_id, books_df):
+        book = books_df[books_df['book_id'] == book_id]
+        if book.empty:
+            return f"There is no book with ID {book_id} in the catalog."
+        return _book_line(book.iloc[0])
+
+    def _count(self, available_only, books_df):
+        total_titles = len(books_df)
+        available = books_df[books_df['copies'] > 0]
+        copies_on_shelf = int(available['copies'].sum())
+        if available_only:
+            return f"{len(available)} of {total_titles} titles are available right now, with {copies_on_shelf} copies on the shelf in total."
+        return f"The catalog has {total_titles} titles; {len(available)} of them are available ({copies_on_shelf} copies on the shelf)."
+
+    def _count_tag(self, tag, available_only, books_df, books_by_tag):
+        matches = _tagged(books_df, books_by_tag, tag)
+        available = matches[matches['copies'] > 0]
+        if available_only:
+            return f"{len(available)} of {len(matches)} titles tagged '{tag}' are available right now, with {int(available['copies'].sum())} copies on the shelf."
+        noun = "title is" if len(matches) == 1 else "titles are"
+        return f"{len(matches)} {noun} tagged '{tag}'; {len(available)} of them available ({int(available['copies'].sum())} copies on the shelf)."
+
+    def _latest_n(self, n, kind, book_id, books_df, transactions_df):
+        if book_id is not None:
+            if not (books_df['book_id'] == book_id).any():
+                return f"There is no book with ID {book_id} in the catalog."
+            transactions_df = transactions_df[transactions_df['book_id'] == book_id]
+        if kind.startswith('borrow'):
+            rows = _last_rows(transactions_df, n, 'borrow')
+            label = "borrowed"
+        elif kind.startswith('return'):
+            rows = _last_rows(transactions_df, n, 'return')
+            label = "returned"
+        else:
+            rows = transactions_df.tail(n)
+            label = "transactions"
+        rows = rows.iloc[::-1]
+        scope = f" for Book ID {book_id}" if book_id is not None else ""
+        if rows.empty:
+            return f"No {label} books recorded yet{scope}." if label != "transactions" else f"No transactions recorded yet{scope}."
+        listed = books_df[books_df['book_id'].isin(rows['book_id'])]
+        titles = rows['book_id'].map(listed.set_index('book_id')['title']).fillna('Unknown title')
+        lines = [
+            f"- **{title}** (Book ID {row['book_id']}) {row['action']}ed by {row['user_name']} on {row['timestamp']}"
+            for title, (_, row) in zip(titles, rows.iterrows())
+        ]
+        if label == "transactions":
+            heading = f"Last {len(rows)} transactions{scope}:" if len(rows) > 1 else f"Most recent transaction{scope}:"
+        else:
+            heading = f"Last {len(rows)} {label} books{scope}:" if len(rows) > 1 else f"Most recently {label}{scope}:"
+        return heading + "\n" + "\n".join(lines)
+
+    def _filter_by_tag(self, tag, available_only, books_df, books_by_tag):
+        matches = _tagged(books_df, books_by_tag, tag)
+        if available_only:
+            matches = matches[matches['copies'] > 0]
+        qualifier = "available " if available_only else ""
+        if matches.empty:
+            return f"There are no {qualifier}books tagged '{tag}' in the catalog."
+        noun = "book" if len(matches) == 1 else "books"
+        lines = [_book_line(book) for _, book in matches.head(MAX_LISTED).iterrows()]
+        if len(matches) > MAX_LISTED:
+            lines.append(f"- and {len(matches) - MAX_LISTED} more")
+        return f"{len(matches)} {qualifier}{noun} tagged '{tag}':\n" + "\n".join(lines)
+
+    def record(self, route, seconds):
+        with self.lock:
+            stats = self.route_stats.setdefault(route, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def stats(self):
+        with self.lock:
+            return {
+                route: {'count': count, 'avg_ms': total / count * 1000, 'max_ms': worst * 1000}
+                for route, (count, total, worst) in self.route_stats.items()
+            }
@@ -0,0 +1,41 @@
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:  # snapshots are an optimization; without pyarrow every read parses the workbook
+    pa = None
+    feather = None
+
+def snapshot_path(xlsx_path):
+    return os.path.splitext(xlsx_path)[0] + '.arrow'
+
+def write_snapshot(df, xlsx_path):
+    if feather is None:
+        return False
+    path = snapshot_path(xlsx_path)
+    tmp_path = path + '.tmp'
+    try:
+        # Uncompressed Arrow IPC can be memory-mapped and read column by column without copying
+        feather.write_feather(df, tmp_path, compression='uncompressed')
+    except (pa.ArrowException, ValueError, TypeError):
+        # Mixed-type object columns (e.g. phone numbers stored as both int and str) cannot be
+        # converted; fall back to parsing the workbook for this file
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+def read_snapshot(xlsx_path, columns=None):
+    # Raises FileNotFoundError like pd.read_excel when the workbook is missing
+    xlsx_mtime = os.path.getmtime(xlsx_path)
+    path = snapshot_path(xlsx_path)
+    if feather is not None and os.path.exists(path) and os.path.getmtime(path) >= xlsx_mtime:
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+    df = pd.read_excel(xlsx_path)
+    write_snapshot(df, xlsx_path)
+    return df[columns] if columns else df
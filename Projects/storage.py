@@ -0,0 +1,480 @@
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from inventory import Inventory
+from snapshot import read_snapshot, write_snapshot
+
+BOOK_COLUMNS = ['book_id', 'title', 'author', 'copies', 'description', 'tags']
+TRANSACTION_COLUMNS = ['transaction_id', 'book_id', 'action', 'user_name', 'user_college', 'user_id_email', 'user_phone', 'timestamp']
+EDITABLE_BOOK_COLUMNS = ['title', 'author', 'copies', 'description', 'tags']
+
+DATA_DIR = os.getenv('LIBRARY_DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
+STORAGE_ENGINE = os.getenv('LIBRARY_STORAGE', 'sqlite')  # 'sqlite' or 'excel'
+DEFAULT_PAGE_SIZE = 50
+EXPORT_CHUNK_SIZE = 10000
+BOOK_SEARCH_COLUMNS = ['title', 'author', 'tags']
+NEXT_VERSION = "(SELECT value + 1 FROM meta WHERE key = 'data_version')"  # the version the open write will commit as
+
+def new_transaction(book_id, action, user_details):
+    return {
+        'book_id': book_id,
+        'action': action,
+        'user_name': user_details['name'],
+        'user_college': user_details['college'],
+        'user_id_email': user_details['id_email'],
+        'user_phone': user_details['phone'],
+        'timestamp': pd.Timestamp.now().isoformat()
+    }
+
+def _load_inventory(storage):
+    inventory = Inventory()
+    inventory.rebuild(storage.read_books(['book_id', 'copies']), storage.read_transactions(['book_id', 'action', 'user_id_email']))
+    return inventory
+
+def _page_bounds(page, page_size):
+    page_size = max(1, int(page_size))
+    return (max(1, int(page)) - 1) * page_size, page_size
+
+def _sort_column(sort, all_columns, default):
+    return sort if sort in all_columns else default
+
+def _query_frame(df, filters, sort, descending, page, page_size):
+    # In-memory counterpart of SQLiteStorage._query for the Excel backend
+    for column, value in filters:
+        if column == 'search':
+            text = df[BOOK_SEARCH_COLUMNS].fillna('').astype(str).agg(' '.join, axis=1).str.lower()
+            df = df[text.str.contains(value.lower(), regex=False)]
+        elif column == 'available':
+            df = df[df['copies'] > 0]
+        elif column == 'since':
+            df = df[df['timestamp'].astype(str) >= value]
+        elif column == 'until':
+            df = df[df['timestamp'].astype(str) < value]
+        else:
+            df = df[df[column] == value]
+    offset, limit = _page_bounds(page, page_size)
+    return df.sort_values(sort, ascending=not descending).iloc[offset:offset + limit].reset_index(drop=True), len(df)
+
+class ExcelStorage:
+    # Legacy backend: every write rewrites the whole workbook, so writes are serialized per process
+    def __init__(self, data_dir=DATA_DIR):
+        self.books_path = os.path.join(data_dir, 'books.xlsx')
+        self.transactions_path = os.path.join(data_dir, 'transactions.xlsx')
+        self.lock = threading.RLock()
+        self.inventory = None
+
+    def _inventory(self):
+        with self.lock:
+            if self.inventory is None:
+                self.inventory = _load_inventory(self)
+            return self.inventory
+
+    def changes_since(self, version, last_transaction_id):
+        return None  # workbooks are only ever read whole
+
+    def data_version(self):
+        # Workbook mtimes, so writes from other processes (or edits made in Excel) are seen too
+        return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else 0 for path in (self.books_path, self.transactions_path))
+
+    def read_books(self, columns=None):
+        try:
+            return read_snapshot(self.books_path, columns)
+        except FileNotFoundError:
+            return pd.DataFrame(columns=columns or BOOK_COLUMNS)
+
+    def read_transactions(self, columns=None):
+        try:
+            return read_snapshot(self.transactions_path, columns)
+        except FileNotFoundError:
+            return pd.DataFrame(columns=columns or TRANSACTION_COLUMNS)
+
+    def query_books(self, search=None, available_only=False, sort='book_id', descending=False, page=1, page_size=DEFAULT_PAGE_SIZE):
+        filters = ([('search', search)] if search else []) + ([('available', True)] if available_only else [])
+        return _query_frame(self.read_books(), filters, _sort_column(sort, BOOK_COLUMNS, 'book_id'), descending, page, page_size)
+
+    def query_transactions(self, book_id=None, action=None, since=None, until=None, sort='transaction_id', descending=True, page=1, page_size=DEFAULT_PAGE_SIZE):
+        filters = [(column, value) for column, value in [('book_id', book_id), ('action', action), ('since', since), ('until', until)] if value is not None]
+        return _query_frame(self.read_transactions(), filters, _sort_column(sort, TRANSACTION_COLUMNS, 'transaction_id'), descending, page, page_size)
+
+    def open_loans(self, id_email):
+        return self._inventory().open_loans(id_email)
+
+    def iter_transactions(self, chunk_size=EXPORT_CHUNK_SIZE):
+        transactions = self.read_transactions()
+        for start in range(0, len(transactions), chunk_size):
+            yield transactions.iloc[start:start + chunk_size]
+
+    def _save(self, df, path):
+        df.to_excel(path, index=False)
+        write_snapshot(df, path)
+
+    def _append_transaction(self, transactions, book_id, action, user_details):
+        row = {'transaction_id': len(transactions) + 1, **new_transaction(book_id, action, user_details)}
+        return pd.concat([transactions, pd.DataFrame([row])], ignore_index=True)
+
+    def borrow_book(self, book_id, user_details):
+        with self.lock:
+            inventory = self._inventory()
+            if not inventory.can_borrow(book_id):
+                return False
+            books = self.read_books()
+            transactions = self._append_transaction(self.read_transactions(), book_id, 'borrow', user_details)
+            books.loc[books['book_id'] == book_id, 'copies'] -= 1
+            self._save(books, self.books_path)
+            self._save(transactions, self.transactions_path)
+            inventory.borrow(book_id, user_details['id_email'])
+            return True
+
+    def return_book(self, book_id, user_details):
+        # Only a copy this ID/Email actually has out can be returned
+        with self.lock:
+            inventory = self._inventory()
+            if not inventory.can_return(book_id, user_details['id_email']):
+                return False
+            books = self.read_books()
+            transactions = self._append_transaction(self.read_transactions(), book_id, 'return', user_details)
+            books.loc[books['book_id'] == book_id, 'copies'] += 1
+            self._save(books, self.books_path)
+            self._save(transactions, self.transactions_path)
+            inventory.return_copy(book_id, user_details['id_email'])
+            return True
+
+    def add_book(self, book_data):
+        with self.lock:
+            books = self.read_books()
+            book_id = len(books) + 1
+            new_book = pd.DataFrame([{'book_id': book_id, **{key: book_data[key] for key in EDITABLE_BOOK_COLUMNS}}])
+            books = pd.concat([books, new_book], ignore_index=True)
+            self._save(books, self.books_path)
+            if self.inventory is not None:
+                self.inventory.set_copies(book_id, book_data['copies'])
+            return book_id
+
+    def add_books(self, new_books):
+        # Bulk insert: one workbook rewrite for the whole batch; returns the assigned ids
+        with self.lock:
+            books = self.read_books()
+            start = int(books['book_id'].max()) + 1 if not books.empty else 1
+            new_books = new_books[EDITABLE_BOOK_COLUMNS].assign(book_id=range(start, start + len(new_books)))[BOOK_COLUMNS]
+            self._save(pd.concat([books, new_books], ignore_index=True), self.books_path)
+            if self.inventory is not None:
+                for book_id, copies in zip(new_books['book_id'], new_books['copies']):
+                    self.inventory.set_copies(book_id, copies)
+            return new_books['book_id'].tolist()
+
+    def edit_book(self, book_id, book_data):
+        with self.lock:
+            books = self.read_books()
+            if book_id not in books['book_id'].values:
+                return False
+            for key, value in book_data.items():
+                books.loc[books['book_id'] == book_id, key] = value
+            self._save(books, self.books_path)
+            if 'copies' in book_data and self.inventory is not None:
+                self.inventory.set_copies(book_id, book_data['copies'])
+            return True
+
+class SQLiteStorage:
+    # Default backend: WAL mode lets readers run alongside a single writer, and each
+    # borrow/return is one atomic UPDATE plus one INSERT regardless of log size
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.db_path = os.path.join(data_dir, 'library.db')
+        self.local = threading.local()
+        self.inventory = None
+        self.inventory_version = None  # data_version the inventory reflects
+        self.inventory_lock = threading.Lock()
+        self._create_schema()
+        self._seed_from_excel()
+
+    def _conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: transactions are managed explicitly in _write()
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _inventory(self):
+        # Rebuilt when data_version has moved for a write this instance did not make (ingest.py,
+        # storage.py import, another server process). Inside _write() no other writer can interleave
+        with self.inventory_lock:
+            version = self.data_version()
+            if self.inventory is None or self.inventory_version != version:
+                self.inventory = _load_inventory(self)
+                self.inventory_version = version
+            return self.inventory
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        changes = conn.total_changes
+        version = self.data_version()
+        try:
+            yield conn
+            if conn.total_changes != changes:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+                if self.inventory_version == version:  # this write was applied to the inventory too
+                    self.inventory_version = version + 1
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _create_schema(self):
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS books (
+            book_id INTEGER PRIMARY KEY,
+            title TEXT, author TEXT, copies INTEGER NOT NULL DEFAULT 0, description TEXT, tags TEXT)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL, action TEXT NOT NULL, user_name TEXT, user_college TEXT,
+            user_id_email TEXT, user_phone TEXT, timestamp TEXT NOT NULL)""")
+        # data_version moves with every committed write, whichever process made it
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0)")
+        # reset_version: the version that last replaced both tables wholesale (import, seed)
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('reset_version', 0)")
+        # books.changed_version is stamped by triggers with the version of the write that touched the row,
+        # so changes_since() can hand back just the edited books, whichever process wrote them
+        if 'changed_version' not in {row[1] for row in conn.execute("PRAGMA table_info(books)")}:
+            conn.execute("ALTER TABLE books ADD COLUMN changed_version INTEGER NOT NULL DEFAULT 0")
+        for trigger, event in [('books_changed_insert', 'INSERT'), ('books_changed_update', f"UPDATE OF {', '.join(EDITABLE_BOOK_COLUMNS)}")]:
+            conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON books BEGIN
+                UPDATE books SET changed_version = {NEXT_VERSION} WHERE book_id = NEW.book_id; END""")
+        conn.execute("CREATE INDEX IF NOT EXISTS books_changed_version ON books (changed_version)")
+        # books.book_id is the rowid; these back the per-book, per-action and time-range filters
+        conn.execute("CREATE INDEX IF NOT EXISTS transactions_book_id ON transactions (book_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS transactions_timestamp ON transactions (timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS transactions_action ON transactions (action, transaction_id)")
+
+    def data_version(self):
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()[0]
+
+    def changes_since(self, version, last_transaction_id):
+        # (books changed after version, transactions after last_transaction_id), read in one
+        # snapshot; None when the tables were replaced since then and have to be reloaded in full
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            reset_version = conn.execute("SELECT value FROM meta WHERE key = 'reset_version'").fetchone()[0]
+            if version is None or reset_version > version:
+                return None
+            books = pd.read_sql_query(
+                f"SELECT {', '.join(BOOK_COLUMNS)} FROM books WHERE changed_version > ? ORDER BY book_id", conn, params=[int(version)]
+            )
+            transactions = pd.read_sql_query(
+                f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions WHERE transaction_id > ? ORDER BY transaction_id", conn, params=[int(last_transaction_id)]
+            )
+            return books, transactions
+        finally:
+            conn.execute("COMMIT")
+
+    def _mark_reset(self, conn):
+        conn.execute(f"UPDATE meta SET value = {NEXT_VERSION} WHERE key = 'reset_version'")
+
+    def _has_rows(self, conn):
+        return conn.execute("SELECT EXISTS (SELECT 1 FROM books) OR EXISTS (SELECT 1 FROM transactions)").fetchone()[0]
+
+    def _seed_from_excel(self):
+        # Decided from the tables rather than from library.db existing, so a first import that
+        # failed or found no workbook is retried on the next start instead of leaving an empty catalog
+        if self._has_rows(self._conn()):
+            return
+        excel = ExcelStorage(self.data_dir)
+        books = excel.read_books()
+        if books.empty:
+            return
+        transactions = excel.read_transactions()
+        with self._write() as conn:
+            if self._has_rows(conn):  # another process seeded it meanwhile
+                return
+            self._insert_rows(conn, 'books', books, BOOK_COLUMNS)
+            self._insert_rows(conn, 'transactions', transactions, TRANSACTION_COLUMNS)
+            self._mark_reset(conn)
+
+    def _select(self, table, all_columns, columns, order_by):
+        columns = [column for column in (columns or all_columns) if column in all_columns]
+        return pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {order_by}", self._conn())
+
+    def read_books(self, columns=None):
+        return self._select('books', BOOK_COLUMNS, columns, 'book_id')
+
+    def read_transactions(self, columns=None):
+        return self._select('transactions', TRANSACTION_COLUMNS, columns, 'transaction_id')
+
+    def _query(self, table, columns, conditions, params, sort, descending, page, page_size):
+        # Returns (one page as a DataFrame, total matching rows); only the page is materialized
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        offset, limit = _page_bounds(page, page_size)
+        total = self._conn().execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+        rows = pd.read_sql_query(
+            f"SELECT {', '.join(columns)} FROM {table}{where} ORDER BY {sort} {'DESC' if descending else 'ASC'} LIMIT ? OFFSET ?",
+            self._conn(), params=[*params, limit, offset]
+        )
+        return rows, total
+
+    def query_books(self, search=None, available_only=False, sort='book_id', descending=False, page=1, page_size=DEFAULT_PAGE_SIZE):
+        conditions, params = [], []
+        if search:
+            conditions.append('(' + ' OR '.join(f"{column} LIKE ?" for column in BOOK_SEARCH_COLUMNS) + ')')
+            params += [f"%{search}%"] * len(BOOK_SEARCH_COLUMNS)
+        if available_only:
+            conditions.append("copies > 0")
+        return self._query('books', BOOK_COLUMNS, conditions, params, _sort_column(sort, BOOK_COLUMNS, 'book_id'), descending, page, page_size)
+
+    def query_transactions(self, book_id=None, action=None, since=None, until=None, sort='transaction_id', descending=True, page=1, page_size=DEFAULT_PAGE_SIZE):
+        conditions, params = [], []
+        for condition, value in [("book_id = ?", book_id), ("action = ?", action), ("timestamp >= ?", since), ("timestamp < ?", until)]:
+            if value is not None:
+                conditions.append(condition)
+                params.append(int(value) if condition.startswith('book_id') else value)
+        return self._query('transactions', TRANSACTION_COLUMNS, conditions, params, _sort_column(sort, TRANSACTION_COLUMNS, 'transaction_id'), descending, page, page_size)
+
+    def iter_transactions(self, chunk_size=EXPORT_CHUNK_SIZE):
+        # Keyset pagination on the primary key, so each chunk costs the same however deep the log is
+        last_id = 0
+        while True:
+            chunk = pd.read_sql_query(
+                f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions WHERE transaction_id > ? ORDER BY transaction_id LIMIT ?",
+                self._conn(), params=[last_id, chunk_size]
+            )
+            if chunk.empty:
+                return
+            yield chunk
+            last_id = int(chunk['transaction_id'].iloc[-1])
+
+    def _insert_transaction(self, conn, book_id, action, user_details):
+        row = new_transaction(book_id, action, user_details)
+        conn.execute(
+            f"INSERT INTO transactions ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+            list(row.values())
+        )
+
+    def _copies(self, conn, book_id):
+        return conn.execute("SELECT copies FROM books WHERE book_id = ?", (book_id,)).fetchone()[0]
+
+    def borrow_book(self, book_id, user_details):
+        # The conditional UPDATE stays the authority on stock, since other processes (ingest.py,
+        # storage.py import) can change the catalog; the inventory learns the new shelf count from it
+        with self._write() as conn:
+            inventory = self._inventory()
+            updated = conn.execute("UPDATE books SET copies = copies - 1 WHERE book_id = ? AND copies > 0", (int(book_id),)).rowcount
+            if not updated:
+                return False
+            self._insert_transaction(conn, int(book_id), 'borrow', user_details)
+            inventory.borrow(book_id, user_details['id_email'], self._copies(conn, int(book_id)))
+            return True
+
+    def return_book(self, book_id, user_details):
+        # Only a copy this ID/Email actually has out can be returned. Checked again under the
+        # write lock so two concurrent returns of the same loan cannot both pass
+        if not self._inventory().can_return(book_id, user_details['id_email']):
+            return False
+        with self._write() as conn:
+            inventory = self._inventory()
+            if not inventory.can_return(book_id, user_details['id_email']):
+                return False
+            updated = conn.execute("UPDATE books SET copies = copies + 1 WHERE book_id = ?", (int(book_id),)).rowcount
+            if not updated:
+                return False
+            self._insert_transaction(conn, int(book_id), 'return', user_details)
+            inventory.return_copy(book_id, user_details['id_email'], self._copies(conn, int(book_id)))
+            return True
+
+    def add_book(self, book_data):
+        with self._write() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO books ({', '.join(EDITABLE_BOOK_COLUMNS)}) VALUES ({', '.join('?' * len(EDITABLE_BOOK_COLUMNS))})",
+                [book_data[key] for key in EDITABLE_BOOK_COLUMNS]
+            )
+            if self.inventory is not None:
+                self.inventory.set_copies(cursor.lastrowid, book_data['copies'])
+        return cursor.lastrowid
+
+    def add_books(self, new_books):
+        # Bulk insert in a single transaction; returns the assigned ids
+        with self._write() as conn:
+            start = conn.execute("SELECT COALESCE(MAX(book_id), 0) + 1 FROM books").fetchone()[0]
+            new_books = new_books[EDITABLE_BOOK_COLUMNS].assign(book_id=range(start, start + len(new_books)))
+            self._insert_rows(conn, 'books', new_books, BOOK_COLUMNS)
+            if self.inventory is not None:  # otherwise it is built from the table, new rows included
+                for book_id, copies in zip(new_books['book_id'], new_books['copies']):
+                    self.inventory.set_copies(book_id, copies)
+        return new_books['book_id'].tolist()
+
+    def edit_book(self, book_id, book_data):
+        updates = {key: value for key, value in book_data.items() if key in EDITABLE_BOOK_COLUMNS}
+        with self._write() as conn:
+            if not conn.execute("SELECT 1 FROM books WHERE book_id = ?", (int(book_id),)).fetchone():
+                return False
+            if updates:
+                assignments = ', '.join(f"{key} = ?" for key in updates)
+                conn.execute(f"UPDATE books SET {assignments} WHERE book_id = ?", [*updates.values(), int(book_id)])
+            if 'copies' in updates and self.inventory is not None:
+                self.inventory.set_copies(book_id, updates['copies'])
+        return True
+
+    def open_loans(self, id_email):
+        return self._inventory().open_loans(id_email)
+
+    def _insert_rows(self, conn, table, df, columns):
+        if df.empty:
+            return
+        # astype(object) + tolist() hands sqlite3 plain Python values instead of numpy scalars
+        values = df[columns].astype(object).where(df[columns].notna(), None).values.tolist()
+        conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+
+    def replace_all(self, books, transactions):
+        # Swaps the whole catalog and log in one transaction
+        with self._write() as conn:
+            conn.execute("DELETE FROM books")
+            conn.execute("DELETE FROM transactions")
+            self._insert_rows(conn, 'books', books, BOOK_COLUMNS)
+            self._insert_rows(conn, 'transactions', transactions, TRANSACTION_COLUMNS)
+            self._mark_reset(conn)
+        self.inventory = None  # rebuilt from the new log on next use
+        return len(books), len(transactions)
+
+    def import_excel(self, data_dir=None):
+        excel = ExcelStorage(data_dir or self.data_dir)
+        return self.replace_all(excel.read_books(), excel.read_transactions())
+
+    def export_excel(self, data_dir=None):
+        excel = ExcelStorage(data_dir or self.data_dir)
+        books = self.read_books()
+        transactions = self.read_transactions()
+        excel._save(books, excel.books_path)
+        excel._save(transactions, excel.transactions_path)
+        return len(books), len(transactions)
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = ExcelStorage() if STORAGE_ENGINE == 'excel' else SQLiteStorage()
+        return _storage
+
+if __name__ == '__main__':
+    # python storage.py import|export  -- sync library.db with books.xlsx / transactions.xlsx
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    storage = SQLiteStorage()
+    if command == 'import':
+        books_count, transactions_count = storage.import_excel()
+        print(f"Imported {books_count} books and {transactions_count} transactions into {storage.db_path}")
+    elif command == 'export':
+        books_count, transactions_count = storage.export_excel()
+        print(f"Exported {books_count} books and {transactions_count} transactions to Excel in {storage.data_dir}")
+    else:
+        print("Usage: python storage.py import|export")
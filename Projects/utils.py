@@ -1,110 +1,75 @@
-import pandas as pd
-import os
-
-def read_books():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    books_path = os.path.join(script_dir, 'books.xlsx')
-    try:
-        df = pd.read_excel(books_path)
-        return df
-    except FileNotFoundError:
-        return pd.DataFrame(columns=['book_id', 'title', 'author', 'copies', 'description', 'tags'])
-
-def read_transactions():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    transactions_path = os.path.join(script_dir, 'transactions.xlsx')
-    try:
-        df = pd.read_excel(transactions_path)
-        return df
-    except FileNotFoundError:
-        return pd.DataFrame(columns=['transaction_id', 'book_id', 'action', 'user_name', 'user_college', 'user_id_email', 'user_phone', 'timestamp'])
-
-def borrow_book(book_id, user_details):
-    books = read_books()
-    transactions = read_transactions()
-    
-    if book_id not in books['book_id'].values or books.loc[books['book_id'] == book_id, 'copies'].iloc[0] <= 0:
-        return False, "Book not available or invalid book ID."
-    
-    new_transaction = pd.DataFrame({
-        'transaction_id': [len(transactions) + 1],
-        'book_id': [book_id],
-        'action': ['borrow'],
-        'user_name': [user_details['name']],
-        'user_college': [user_details['college']],
-        'user_id_email': [user_details['id_email']],
-        'user_phone': [user_details['phone']],
-        'timestamp': [pd.Timestamp.now().isoformat()]
-    })
-    
-    transactions = pd.concat([transactions, new_transaction], ignore_index=True)
-    books.loc[books['book_id'] == book_id, 'copies'] -= 1
-    
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    books_path = os.path.join(script_dir, 'books.xlsx')
-    transactions_path = os.path.join(script_dir, 'transactions.xlsx')
-    books.to_excel(books_path, index=False)
-    transactions.to_excel(transactions_path, index=False)
-    
-    return True, f"Book {book_id} borrowed successfully by {user_details['name']}."
-
-def return_book(book_id, user_details):
-    books = read_books()
-    transactions = read_transactions()
-    
-    if book_id not in books['book_id'].values or books.loc[books['book_id'] == book_id, 'copies'].iloc[0] >= books['copies'].max():
-        return False, "Invalid book ID or book not borrowed."
-    
-    new_transaction = pd.DataFrame({
-        'transaction_id': [len(transactions) + 1],
-        'book_id': [book_id],
-        'action': ['return'],
-        'user_name': [user_details['name']],
-        'user_college': [user_details['college']],
-        'user_id_email': [user_details['id_email']],
-        'user_phone': [user_details['phone']],
-        'timestamp': [pd.Timestamp.now().isoformat()]
-    })
-    
-    transactions = pd.concat([transactions, new_transaction], ignore_index=True)
-    books.loc[books['book_id'] == book_id, 'copies'] += 1
-    
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    books_path = os.path.join(script_dir, 'books.xlsx')
-    transactions_path = os.path.join(script_dir, 'transactions.xlsx')
-    books.to_excel(books_path, index=False)
-    transactions.to_excel(transactions_path, index=False)
-    
-    return True, f"Book {book_id} returned successfully by {user_details['name']}."
-
-def add_book(book_data):
-    books = read_books()
-    new_book = pd.DataFrame({
-        'book_id': [len(books) + 1],
-        'title': [book_data['title']],
-        'author': [book_data['author']],
-        'copies': [book_data['copies']],
-        'description': [book_data['description']],
-        'tags': [book_data['tags']]
-    })
-    books = pd.concat([books, new_book], ignore_index=True)
-    
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    books_path = os.path.join(script_dir, 'books.xlsx')
-    books.to_excel(books_path, index=False)
-    
-    return len(books)
-
-def edit_book(book_id, book_data):
-    books = read_books()
-    if book_id not in books['book_id'].values:
-        return False, "Invalid book ID."
-    
-    for key, value in book_data.items():
-        books.loc[books['book_id'] == book_id, key] = value
-    
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    books_path = os.path.join(script_dir, 'books.xlsx')
-    books.to_excel(books_path, index=False)
-    
-    return True, f"Book {book_id} updated successfully."
\ No newline at end of file
+from metrics import timed
+from storage import DEFAULT_PAGE_SIZE, EXPORT_CHUNK_SIZE, TRANSACTION_COLUMNS, get_storage
+
+def data_version():
+    # Read from storage rather than counted in this process, so process-wide caches (shared RAG
+    # engine, Streamlit data cache) also go stale on writes from ingest.py or storage.py import
+    return get_storage().data_version()
+
+@timed('storage.read_books')
+def read_books(columns=None):
+    return get_storage().read_books(columns)
+
+@timed('storage.read_transactions')
+def read_transactions(columns=None):
+    return get_storage().read_transactions(columns)
+
+@timed('storage.changes_since')
+def changes_since(version, last_transaction_id):
+    # (changed books, new transactions) since an earlier data_version(), or None to reload in full
+    return get_storage().changes_since(version, last_transaction_id)
+
+@timed('storage.query_books')
+def query_books(search=None, available_only=False, sort='book_id', descending=False, page=1, page_size=DEFAULT_PAGE_SIZE):
+    return get_storage().query_books(search, available_only, sort, descending, page, page_size)
+
+@timed('storage.query_transactions')
+def query_transactions(book_id=None, action=None, since=None, until=None, sort='transaction_id', descending=True, page=1, page_size=DEFAULT_PAGE_SIZE):
+    return get_storage().query_transactions(book_id, action, since, until, sort, descending, page, page_size)
+
+def iter_transactions_csv(chunk_size=EXPORT_CHUNK_SIZE):
+    # Yields the transaction log as CSV text one chunk at a time, header first
+    header = True
+    for chunk in get_storage().iter_transactions(chunk_size):
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield ','.join(TRANSACTION_COLUMNS) + '\n'
+
+@timed('storage.borrow_book')
+def borrow_book(book_id, user_details):
+    if not get_storage().borrow_book(book_id, user_details):
+        return False, "Book not available or invalid book ID."
+    return True, f"Book {book_id} borrowed successfully by {user_details['name']}."
+
+@timed('storage.return_book')
+def return_book(book_id, user_details):
+    if not get_storage().return_book(book_id, user_details):
+        return False, "Invalid book ID or no copy of this book is on loan to this ID/Email."
+    return True, f"Book {book_id} returned successfully by {user_details['name']}."
+
+@timed('storage.open_loans')
+def open_loans(id_email):
+    # book_id -> copies currently on loan to this ID/Email
+    return get_storage().open_loans(id_email)
+
+@timed('storage.add_book')
+def add_book(book_data):
+    return get_storage().add_book(book_data)
+
+@timed('storage.add_books')
+def add_books(books):
+    return get_storage().add_books(books)
+
+@timed('storage.edit_book')
+def edit_book(book_id, book_data):
+    if not get_storage().edit_book(book_id, book_data):
+        return False, "Invalid book ID."
+    return True, f"Book {book_id} updated successfully."
+
+def export_excel():
+    storage = get_storage()
+    if not hasattr(storage, 'export_excel'):
+        return False, "Excel files are already the active storage."
+    books_count, transactions_count = storage.export_excel()
+    return True, f"Exported {books_count} books and {transactions_count} transactions to Excel."
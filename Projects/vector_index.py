@@ -0,0 +1,132 @@
+import json
+import logging
+import math
+import os
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Flat (exact) search below the threshold, approximate search above it
+ANN_THRESHOLD = int(os.getenv('RAG_ANN_THRESHOLD', '50000'))
+ANN_KIND = os.getenv('RAG_ANN_KIND', 'hnsw')  # 'hnsw', 'ivf' or 'ivfpq'
+HNSW_M = int(os.getenv('RAG_HNSW_M', '32'))
+HNSW_EF_CONSTRUCTION = int(os.getenv('RAG_HNSW_EF_CONSTRUCTION', '200'))
+HNSW_EF_SEARCH = int(os.getenv('RAG_HNSW_EF_SEARCH', '64'))  # higher = better recall, slower queries
+IVF_NLIST = int(os.getenv('RAG_IVF_NLIST', '0'))  # 0 = 4 * sqrt(rows)
+IVF_NPROBE = int(os.getenv('RAG_IVF_NPROBE', '16'))  # higher = better recall, slower queries
+PQ_M = int(os.getenv('RAG_PQ_M', '16'))  # sub-quantizers; each vector is stored in PQ_M bytes
+SAVE_EVERY = int(os.getenv('RAG_INDEX_SAVE_EVERY', '1000'))  # unsaved additions before the index is written again
+
+class VectorIndex:
+    # Id-keyed FAISS index that starts exact and switches itself to HNSW or IVF(-PQ) once it
+    # grows past ANN_THRESHOLD. Trained indexes are persisted so restarts skip training.
+    def __init__(self, dim, path=None, model_name=None):
+        self.dim = dim
+        self.path = path
+        self.model_name = model_name
+        self.kind = 'flat'
+        self.index = faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+        self.ids = set()
+        self.fingerprint = None  # set by the owner to tie the saved vectors to the data they came from
+        self.unsaved = 0
+        if path:
+            self._load()
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def add_with_ids(self, vectors, ids):
+        self.index.add_with_ids(vectors, ids)
+        self.ids.update(int(i) for i in ids)
+        self.unsaved += len(ids)
+        if self.kind == 'flat' and self.ntotal >= ANN_THRESHOLD:
+            vectors, ids = self._flat_contents()
+            self._build(ANN_KIND, vectors, ids)
+
+    def remove_ids(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        self.ids.difference_update(int(i) for i in ids)
+        self.unsaved += len(ids)
+        if self.kind == 'hnsw':
+            # HNSW graphs do not support deletion; rebuild from the remaining vectors
+            vectors, all_ids = self._flat_contents()
+            keep = ~np.isin(all_ids, ids)
+            self._build('hnsw', vectors[keep], all_ids[keep])
+        else:
+            self.index.remove_ids(ids)
+
+    def reset(self):
+        # Drops every vector, e.g. when the ids now belong to different rows
+        self.kind = 'flat'
+        self.index = faiss.IndexIDMap(faiss.IndexFlatL2(self.dim))
+        self.ids = set()
+        self.fingerprint = None
+        self.save()
+
+    def search(self, vectors, top_k):
+        return self.index.search(vectors, top_k)
+
+    def _flat_contents(self):
+        # Flat and HNSW-flat both keep raw vectors, in the same order as the IndexIDMap id list
+        inner = faiss.downcast_index(self.index.index)
+        ids = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+        vectors = inner.reconstruct_n(0, inner.ntotal) if inner.ntotal else np.empty((0, self.dim), dtype=np.float32)
+        return vectors, ids
+
+    def _build(self, kind, vectors, ids):
+        if kind == 'hnsw':
+            hnsw = faiss.IndexHNSWFlat(self.dim, HNSW_M)
+            hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+            index = faiss.IndexIDMap(hnsw)
+        else:
+            nlist = IVF_NLIST or max(1, int(4 * math.sqrt(len(ids))))
+            quantizer = faiss.IndexFlatL2(self.dim)
+            if kind == 'ivfpq' and self.dim % PQ_M == 0:
+                index = faiss.IndexIVFPQ(quantizer, self.dim, nlist, PQ_M, 8)
+            else:
+                kind = 'ivf'
+                index = faiss.IndexIVFFlat(quantizer, self.dim, nlist)
+            index.train(vectors)
+            index.nprobe = IVF_NPROBE
+        if len(ids):
+            index.add_with_ids(vectors, ids)
+        self.kind = kind
+        self.index = index
+        logger.info("Rebuilt transaction index as %s with %d vectors", kind, len(ids))
+        self.save()
+
+    def maybe_save(self):
+        if self.path and self.unsaved >= SAVE_EVERY:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        faiss.write_index(self.index, self.path + '.tmp')
+        os.replace(self.path + '.tmp', self.path)
+        np.save(self.path + '.ids.npy', np.fromiter(self.ids, dtype=np.int64, count=len(self.ids)))
+        with open(self.path + '.json', 'w') as f:
+            json.dump({'kind': self.kind, 'dim': self.dim, 'model': self.model_name, 'fingerprint': self.fingerprint}, f)
+        self.unsaved = 0
+
+    def _load(self):
+        meta_path = self.path + '.json'
+        if not (os.path.exists(self.path) and os.path.exists(meta_path) and os.path.exists(self.path + '.ids.npy')):
+            return
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('dim') != self.dim or meta.get('model') != self.model_name:
+            return  # built with a different embedding model; start over
+        index = faiss.read_index(self.path)
+        if meta['kind'] == 'hnsw':
+            faiss.downcast_index(index.index).hnsw.efSearch = HNSW_EF_SEARCH
+        elif meta['kind'] in ('ivf', 'ivfpq'):
+            index.nprobe = IVF_NPROBE
+        self.kind = meta['kind']
+        self.index = index
+        self.ids = set(np.load(self.path + '.ids.npy').tolist())
+        self.fingerprint = meta.get('fingerprint')